@@ -1,7 +1,10 @@
+import argparse
 import pyxel
 import random
 
+from concurrent.futures import ProcessPoolExecutor
 from functools import partial
+from math import floor
 
 from rogue import debug
 from rogue import misc
@@ -9,8 +12,8 @@ from rogue import misc
 from rogue.actions import end_turn, open_door, unlock_door
 
 from rogue.core import ITEMS, LevelItem, Tool, MenuItem
-from rogue.core import Board, State, VecF, GridCoord
-from rogue.core import dist, index_to_pos, cast_ray
+from rogue.core import Board, GenConfig, State, GridCoord
+from rogue.core import dist, FOV_ENGINES
 from rogue.core import (
     is_empty,
     is_wall,
@@ -29,14 +32,22 @@ from rogue.dungeon_gen import (
     level_2,
     level_3,
     room_anchor,
+    floor_seeds,
+    DEFAULT_CONFIG,
+    Seed,
 )
 
+from rogue.descent import Descent
+from rogue.levelcache import LevelCache
+from rogue.levelpack import build_floor, freeze_pack, swap_floors
 from rogue.particles import DamageText, Projectile, Molecule, Aura, Thunder
 
 from rogue.constants import CELL_SIZE, FPS, TPV, STORY
-from rogue.sprites import WALLS
+from rogue.sprites import TILE_UVS
 
-from typing import List, Optional
+from typing import List, Optional, Sequence
+
+STORY_FLOORS = ["level_1", "level_2", "level_3"]
 
 
 def draw_damage(state, pos, damage, color):
@@ -79,17 +90,11 @@ def can_walk(board: Board, x, y) -> bool:
 
 
 def find_entity(state, x, y):
-    for e in state.enemies:
-        if e.pos == (x, y):
-            return e
-    return None
+    return state.level.actor_at(x, y)
 
 
 def find_item(state, x, y) -> Optional[LevelItem]:
-    for i in state.level.items:
-        if i.square == (x, y):
-            return i
-    return None
+    return state.level.item_at(x, y)
 
 
 def can_shoot(state) -> bool:
@@ -152,7 +157,7 @@ class AimingTool(Tool):
 class Wand(AimingTool):
     def __init__(self, state):
         self.aim = sorted(
-            [e for e in state.enemies if e.square in state.visible],
+            [e for e in state.nearby_enemies() if e.square in state.visible],
             key=lambda x: x.pos[0],
         )
 
@@ -212,7 +217,7 @@ class ThunderTool:
         enemies = sorted(
             [
                 e
-                for e in state.enemies
+                for e in state.nearby_enemies()
                 if e.square in state.visible
                 and dist(state.player.pos, e.pos) < 5
             ],
@@ -239,12 +244,20 @@ class Map:
         if pyxel.btnr(pyxel.KEY_X) or pyxel.btnr(pyxel.KEY_C):
             state.active_tool = None
 
+    span = 32  # squares shown on each axis
+
     def draw(self, state):
-        offx, offy = 48, 48
-        pyxel.rect(offx - 5, offy - 5, 42, 42, 7)
-        pyxel.rect(offx - 4, offy - 4, 40, 40, 0)
-        pyxel.rect(offx - 2, offy - 2, 36, 36, 5)
-        for x, y in state.visited:
+        # on bigger boards, show the part around the player
+        side, span = state.board.side, self.span
+        px, py = state.player.square
+        wx = min(max(px - span // 2, 0), max(side - span, 0))
+        wy = min(max(py - span // 2, 0), max(side - span, 0))
+
+        offx, offy = 48 - wx, 48 - wy
+        pyxel.rect(43, 43, 42, 42, 7)
+        pyxel.rect(44, 44, 40, 40, 0)
+        pyxel.rect(46, 46, 36, 36, 5)
+        for x, y in state.visited.window(wx, wy, span, span):
             col = 7
             v = state.board.get(x, y)
             if is_door(v):
@@ -379,13 +392,14 @@ def player_action(state: State):
 
 
 def game_turn(state: State):
-    if any(e.is_busy() for e in state.enemies):
+    if any(e.is_busy() for e in state.awake):
         return
-    _end = end_turn(state, len(state.enemies))
-    if not state.enemies:
+    # only the enemies around the player play, the others stay idle
+    state.awake = state.nearby_enemies()
+    _end = end_turn(state, len(state.awake))
+    if not state.awake:
         _end(None)
-    state.occupied = set(e.square for e in state.enemies)
-    for e in state.enemies:
+    for e in state.awake:
         # report is either None, or a Pos or a Damage
         report = e.take_action(state, _end)
         if isinstance(report, int):
@@ -393,19 +407,56 @@ def game_turn(state: State):
             draw_damage(state, state.player.pos, report, 8)
         elif report is not None:
             # then they moved
-            state.occupied.add(report)
+            state.level.move_enemy(e, report)
+
+
+def in_sight_range(state: State, pos) -> bool:
+    px, py = state.player.square
+    reach = state.max_range + 1
+    return abs(pos[0] - px) <= reach and abs(pos[1] - py) <= reach
+
+
+# recomputed only when the player square or the board changed, and not
+# while the player is between two squares
+def update_visibility(state: State):
+    px, py = state.player.pos
+    if px != int(px) or py != int(py):
+        return
+
+    key = state.current_level, state.player.square, state.board.revision
+    if key == state.fov_key:
+        return
+    last_key, state.fov_key = state.fov_key, key
+
+    if last_key is not None and last_key[:2] == key[:2]:
+        # only the board changed, skip if it's out of sight
+        changes = state.board.changes_since(last_key[2])
+        if changes is not None and not any(
+            in_sight_range(state, state.board.to_pos(i)) for i in changes
+        ):
+            return
+
+    fov = FOV_ENGINES[state.fov_engine]
+    state.visible = fov(state.board, state.player.square, state.max_range)
+    state.visited |= state.visible
 
 
 def update(state: State) -> State:
     x, y = state.player.pos
 
+    # enemies in view, and the ones still busy with their turn
+    active = dict.fromkeys(state.nearby_enemies())
+    active.update(dict.fromkeys(state.awake))
+
     deads_enemies = []
-    for e in state.enemies:
+    for e in active:
         e.update(state)
         if e.pv < 1:
             deads_enemies.append(e)
     for d in deads_enemies:
-        state.enemies.remove(d)
+        state.level.remove_enemy(d)
+        if d in state.awake:
+            state.awake.remove(d)
 
     if state.text_box is not None:
         state.text_box.update(state)
@@ -439,48 +490,7 @@ def update(state: State) -> State:
     for dp in deads_particles:
         state.particles.remove(dp)
 
-    # store in-range block indices
-    max_range = state.max_range
-    state.in_range = set()
-    for i in range(len(state.board)):
-        x, y = index_to_pos(i, state.board.side)
-        center = x + 0.5, y + 0.5
-        if dist(center, state.player.pos) < max_range * 2:
-            state.in_range.add(i)
-
-    # for i in range(3):
-    #     state.particles.append(Glitter(state.player.pos))
-
-    def ray_dirs(i):
-        px, py = state.player.pos
-        c, r = index_to_pos(i, state.board.side)
-        return [
-            (x - px, y - py)
-            for x, y in [
-                (c + 0.5, r),
-                (c + 1, r + 0.5),
-                (c + 0.5, r + 1),
-                (c, r + 0.5),
-            ]
-            if x - px and y - py
-        ]
-
-    def hit_wall(x, y):
-        return (
-            state.board.outside(x, y)
-            or is_wall(state.board.get(x, y))
-            or dist(state.player.pos, (x, y)) > state.max_range
-            or is_door(state.board.get(x, y))
-        )
-
-    rays: List[VecF] = sum([ray_dirs(i) for i in state.in_range], [])
-    state.visible = set()
-    for r in rays:
-        trav, hit, _ = cast_ray((px + 0.5, py + 0.5), r, hit_wall)
-        state.visible.update(trav)
-        if not state.board.outside(*hit):
-            state.visible.add(hit)
-    state.visited |= state.visible
+    update_visibility(state)
 
     return state
 
@@ -488,40 +498,17 @@ def update(state: State) -> State:
 def draw(state: State):
     pyxel.cls(0)
 
-    non_walls = {
-        0: (32, 16),
-        30: (40, 24),
-        31: (0, 24),
-        32: (8, 24),
-        33: (16, 24),
-        34: (40, 16),
-        35: (48, 8),
-        40: (40, 32),
-        41: (32, 32),
-        42: (32, 32),
-        43: (32, 32),
-        20: (48, 0),
-        21: (56, 16),
-        22: (56, 8),
-        23: (56, 0),
-        25: (64, 0),
-        26: (72, 16),
-        27: (72, 8),
-        28: (72, 0),
-        66: (64, 16),  # UP
-        99: (64, 24),  # DOWN
-    }
-
-    # draw in range
-    for x, y in state.visible:
+    # draw in range, within the screen
+    cx, cy = state.camera
+    span = 128 // CELL_SIZE + 1
+    for x, y in state.visible.window(floor(cx), floor(cy), span, span):
         # for i in range(len(state.board)):
         #     x, y = index_to_pos(i, state.board.side)
         if state.board.outside(x, y):
             continue
         v = state.board.get(x, y)
         x, y = state.to_cam_space((x, y))
-        colors = WALLS if is_wall(v) else non_walls
-        u_, v_ = colors[v]
+        u_, v_ = TILE_UVS[v]
         pyxel.blt(
             x * CELL_SIZE, y * CELL_SIZE, 0, u_, v_, CELL_SIZE, CELL_SIZE
         )
@@ -545,7 +532,7 @@ def draw(state: State):
         1,
     )
 
-    enemies = sorted(state.enemies, key=lambda e: e.zindex)
+    enemies = sorted(state.nearby_enemies(), key=lambda e: e.zindex)
     for enemy in enemies:
         if enemy.square not in state.visible:
             continue
@@ -595,9 +582,9 @@ def draw(state: State):
         pyxel.rect(40, 40, 48, h, 0)
         pyxel.rectb(40, 40, 48, h, 5)
 
-        for i, (code, item, _) in enumerate(menu_):
+        for i, (code, label, _) in enumerate(menu_):
             col = 5 if state.player.cooldown(code) else 7
-            pyxel.text(50, 43 + i * 8, item, col)
+            pyxel.text(50, 43 + i * 8, label, col)
 
         pyxel.blt(41, 42 + state.menu_index * 8, 0, *ITEMS["dot"])
         pyxel.rect(17, 121, 128, 7, 0)
@@ -611,15 +598,43 @@ def draw(state: State):
 class App:
     _debug: bool = False
 
-    def __init__(self):
+    def __init__(
+        self,
+        config: GenConfig = DEFAULT_CONFIG,
+        seed: Seed = None,
+        cache: Optional[LevelCache] = None,
+        kinds: Sequence[str] = STORY_FLOORS,
+        endless: bool = False,
+        hunt: bool = False,
+    ):
         self._title = True
-        self.particles = []
+        self.particles: List[Thunder] = []
         self.story = misc.RollingText(12, 64, STORY)
-        levels = [
-            level_1(),
-            level_2(),
-            level_3(),
+        if seed is None:
+            seed = random.randrange(1 << 32)
+            print(f"seed: {seed}")
+        # floors are built in the background while the title screen shows
+        self._descent = None
+        if endless:
+            self._descent = Descent(config, seed, cache)
+            kinds = []
+        self._pool = ProcessPoolExecutor(max(len(kinds), 1))
+        fetch = build_floor if cache is None else cache.fetch
+        self._floors = [
+            self._pool.submit(fetch, kind, config, s)
+            for kind, s in zip(kinds, floor_seeds(seed, len(kinds)))
         ]
+        self.state = None
+        self._hunt = hunt
+
+    def floors_ready(self) -> bool:
+        if self._descent is not None:
+            return self._descent.ready()
+        return all(f.done() for f in self._floors)
+
+    def start(self):
+        levels = [freeze_pack(f.result()) for f in self._floors]
+        self._pool.shutdown()
         # level = populate_enemies(level)
 
         self.state = State(
@@ -627,10 +642,13 @@ class App:
             current_level=-1,
             camera=(0, 0),
             player=Player((0, 0), 9000),
+            hunt=self._hunt,
         )
-        self.state.visited_by_floor = [
-            set() for _ in range(len(self.state.levels))
-        ]
+        self.state.visited_by_floor = [None] * len(levels)
+        if self._descent is not None:
+            self._descent.attach(self.state)
+        # floors other than the current one are kept frozen
+        self.state.level_listeners.append(swap_floors)
         self.state.change_level(1)
         # self.state.player.flags.add("teleport")
         # self.state.player.flags.add("wand")
@@ -650,12 +668,25 @@ class App:
         pyxel.init(128, 128)
         pyxel.load("my_resource.pyxres")
         pyxel.playm(2, loop=True)
-        pyxel.run(self.update, self.draw)
+        try:
+            pyxel.run(self.update, self.draw)
+        finally:
+            self.close()
+
+    def close(self):
+        for future in self._floors:
+            future.cancel()
+        self._pool.shutdown(wait=False)
+        if self._descent is not None:
+            self._descent.close()
 
     def update(self):
         if self._title:
             self.story.update()
-            if pyxel.btnr(pyxel.KEY_C) or pyxel.btnr(pyxel.KEY_X):
+            if (
+                pyxel.btnr(pyxel.KEY_C) or pyxel.btnr(pyxel.KEY_X)
+            ) and self.floors_ready():
+                self.start()
                 self._title = False
                 pyxel.stop()
                 pyxel.playm(0, loop=True)
@@ -687,6 +718,12 @@ class App:
         if pyxel.btnr(pyxel.KEY_D):
             self._debug = not self._debug
 
+        if pyxel.btnr(pyxel.KEY_F):
+            engines = list(FOV_ENGINES)
+            i = engines.index(self.state.fov_engine)
+            self.state.fov_engine = engines[(i + 1) % len(engines)]
+            self.state.fov_key = None
+
         if self._debug:
             self._update_debug()
         else:
@@ -706,7 +743,7 @@ class App:
         pyxel.cls(0)
 
         for p in self.particles:
-            p.draw(self.state)
+            p.draw(self)
 
         pyxel.text(40, 3, "The Book of", 2)
         pyxel.blt(40, 10, 2, 0, 94, 48, 122)
@@ -715,12 +752,59 @@ class App:
 
         self.story.draw()
         pyxel.rect(0, 100, 128, 50, 0)
-        if (pyxel.frame_count // 15) % 2 == 0:
+        if not self.floors_ready():
+            pyxel.text(34, 115, "Generating...", 5)
+        elif (pyxel.frame_count // 15) % 2 == 0:
             pyxel.text(30, 115, "Press C to start", 7)
 
 
 def main():
-    app = App()
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--rooms",
+        type=int,
+        default=DEFAULT_CONFIG.m_size,
+        help="rooms on each side of a floor",
+    )
+    parser.add_argument(
+        "--room-size",
+        type=int,
+        default=DEFAULT_CONFIG.max_room_size,
+        help="maximum width and height of a room",
+    )
+    parser.add_argument(
+        "--constructive",
+        action="store_true",
+        help="place the final rooms first instead of retrying mazes",
+    )
+    parser.add_argument(
+        "--seed", type=int, help="replay the dungeon of a previous game"
+    )
+    parser.add_argument(
+        "--cache", help="directory where generated floors are kept"
+    )
+    parser.add_argument(
+        "--endless",
+        action="store_true",
+        help="go down an endless dungeon instead of the story floors",
+    )
+    parser.add_argument(
+        "--hunt",
+        action="store_true",
+        help="enemies keep chasing the player once they have seen it",
+    )
+    parser.add_argument(
+        "--caves",
+        action="store_true",
+        help="go through a cave floor between the story floors",
+    )
+    args = parser.parse_args()
+    config = GenConfig(args.rooms, args.room_size, args.constructive)
+    cache = LevelCache(args.cache) if args.cache else None
+    kinds = STORY_FLOORS
+    if args.caves:
+        kinds = ["level_1", "cave", "level_2", "cave", "level_3"]
+    app = App(config, args.seed, cache, kinds, args.endless, args.hunt)
     app.run()
 
 
@@ -0,0 +1,136 @@
+# generate floors without a window, and report how fast it goes:
+# python -m rogue.batch level_1 -n 200 -j 4 --cache levels/
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+from typing import Dict, List, Optional, Tuple
+
+from rogue.core import GenConfig
+from rogue.dungeon_gen import DEFAULT_CONFIG, FLOOR_TYPES, floor_seeds
+from rogue.levelcache import LevelCache
+from rogue.levelpack import pack_level
+
+STAGES = [
+    "matrix",
+    "rooms",
+    "carving",
+    "clean_board",
+    "amend_door",
+    "population",
+]
+
+
+def generate(
+    kind: str, config: GenConfig, seed: int, cache: Optional[LevelCache]
+) -> Dict[str, float]:
+    level = FLOOR_TYPES[kind](config, seed)
+    if cache is not None:
+        cache.store(kind, config, seed, pack_level(level))
+    return level.stats
+
+
+# elapsed seconds and the stats of each floor
+def run(
+    kind: str,
+    n: int,
+    workers: int,
+    config: GenConfig = DEFAULT_CONFIG,
+    seed: int = 0,
+    cache: Optional[LevelCache] = None,
+) -> Tuple[float, List[Dict[str, float]]]:
+    seeds = floor_seeds(seed, n)
+    start = perf_counter()
+    with ProcessPoolExecutor(workers) as pool:
+        chunksize = max(1, n // (workers * 4))
+        stats = list(
+            pool.map(
+                generate,
+                [kind] * n,
+                [config] * n,
+                seeds,
+                [cache] * n,
+                chunksize=chunksize,
+            )
+        )
+    return perf_counter() - start, stats
+
+
+def report(kind, workers, config, elapsed, stats):
+    n = len(stats)
+    totals: Dict[str, float] = {}
+    for floor in stats:
+        for stage, value in floor.items():
+            totals[stage] = totals.get(stage, 0) + value
+
+    print(
+        f"{n} {kind} floors of {config.m_size}x{config.m_size} rooms "
+        f"({config.side}x{config.side} cells), {workers} worker(s)"
+    )
+    print(f"{elapsed:.2f} s, {n / elapsed:.1f} floors/s")
+
+    times = sorted(sum(f.get(s, 0) for s in STAGES) for f in stats)
+    print(
+        f"ms per floor: median {times[n // 2] * 1000:.2f}, "
+        f"p99 {times[n * 99 // 100] * 1000:.2f}, max {times[-1] * 1000:.2f}"
+    )
+
+    attempts = totals.get("attempts", n)
+    print(
+        f"rejected matrices: {attempts - n:.0f} of {attempts:.0f} "
+        f"({(attempts - n) / attempts:.1%}), "
+        f"at most {max(f.get('attempts', 1) for f in stats):.0f} attempts"
+    )
+
+    spent = sum(totals.get(stage, 0) for stage in STAGES)
+    print(f"{'stage':<12} {'ms/floor':>9} {'share':>6}")
+    for stage in STAGES:
+        value = totals.get(stage, 0)
+        print(
+            f"{stage:<12} {value / n * 1000:>9.2f} "
+            f"{value / spent if spent else 0:>6.1%}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m rogue.batch", description="Generate floors headless"
+    )
+    parser.add_argument("kind", choices=sorted(FLOOR_TYPES))
+    parser.add_argument("-n", type=int, default=100, help="floors to build")
+    parser.add_argument(
+        "-j", "--workers", type=int, default=1, help="worker processes"
+    )
+    parser.add_argument("--rooms", type=int, default=DEFAULT_CONFIG.m_size)
+    parser.add_argument(
+        "--room-size", type=int, default=DEFAULT_CONFIG.max_room_size
+    )
+    parser.add_argument(
+        "--constructive",
+        action="store_true",
+        help="place the final rooms first instead of retrying mazes",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--cache", help="store the floors in this level cache directory"
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=64,
+        help="level cache size bound, in MB",
+    )
+    args = parser.parse_args()
+
+    config = GenConfig(args.rooms, args.room_size, args.constructive)
+    cache = None
+    if args.cache:
+        cache = LevelCache(args.cache, args.cache_size << 20)
+    elapsed, stats = run(
+        args.kind, args.n, args.workers, config, args.seed, cache
+    )
+    report(args.kind, args.workers, config, elapsed, stats)
+
+
+if __name__ == "__main__":
+    main()
@@ -17,3 +17,9 @@ STORY = (
     "to steal the most dangerous and precious book of the magic order library. "
     "You must find him, destoy him and bring back the book."
 )
+
+# Tiles fit in a byte, walls are WALL_BASE | TRBL, where each bit tells if
+# the neighbour (Top, Right, Bottom, Left) is also a wall.
+WALL_BASE = 0x80
+UP = 66
+DOWN = 99
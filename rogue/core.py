@@ -1,12 +1,27 @@
 from __future__ import annotations
+from array import array
+from bisect import bisect_left, bisect_right
 from dataclasses import dataclass, field
+from itertools import chain, compress
 from math import sqrt
-from typing import List, Tuple, Any, Set, Optional, Callable, Union
+from typing import (
+    TYPE_CHECKING,
+    List,
+    Tuple,
+    Any,
+    Set,
+    Optional,
+    Callable,
+    Union,
+    Dict,
+)
 
 from rogue import tween
 
-from rogue.constants import FPS, DType, MAX_PV
-from rogue.sprites import WALLS
+from rogue.constants import FPS, DType, MAX_PV, WALL_BASE, UP, DOWN
+
+if TYPE_CHECKING:
+    from rogue.levelpack import FrozenLevel
 
 
 GridCoord = Tuple[int, int]
@@ -54,6 +69,9 @@ Size = Tuple[int, int]
 Position = Tuple[int, int]
 Room = Tuple[Size, Position]
 
+# Level.room_ids of the cells outside of any room or corridor
+NO_ROOM = 0xFFFF
+
 Action = Union[int, GridCoord]
 ActionReport = Optional[Action]
 
@@ -70,6 +88,64 @@ class LevelItem:
     def sprite(self):
         return ITEMS[self.sprite_id]
 
+
+class Occupancy:
+    """Actor and item on each board index, at most one of each"""
+
+    def __init__(self):
+        self.actors: Dict[int, AIActor] = {}
+        self.items: Dict[int, LevelItem] = {}
+        self._where: Dict[AIActor, int] = {}
+
+    def add_actor(self, actor: AIActor, index: int):
+        self.remove_actor(actor)
+        self.actors[index] = actor
+        self._where[actor] = index
+
+    def has_actor(self, actor: AIActor) -> bool:
+        return actor in self._where
+
+    def remove_actor(self, actor: AIActor):
+        index = self._where.pop(actor, None)
+        if index is not None and self.actors.get(index) is actor:
+            del self.actors[index]
+
+    def add_item(self, item: LevelItem, index: int):
+        self.items[index] = item
+
+    def remove_item(self, index: int):
+        self.items.pop(index, None)
+
+
+# rooms of at most max_room_size cells on an m_size x m_size matrix,
+# constructive places the final rooms before digging the maze
+@dataclass(frozen=True)
+class GenConfig:
+    m_size: int = 4
+    max_room_size: int = 8
+    constructive: bool = False
+
+    @property
+    def key(self) -> str:
+        key = f"{self.m_size}x{self.max_room_size}"
+        return key + "c" if self.constructive else key
+
+    @property
+    def side(self) -> int:
+        return self.m_size * self.max_room_size
+
+    @property
+    def n_rooms(self) -> int:
+        return self.m_size * self.m_size
+
+    # top left cell of the matrix slot of a room
+    def room_anchor(self, index: int) -> Position:
+        size = self.max_room_size
+        return index % self.m_size * size, index // self.m_size * size
+
+
+# while playing, enemies and items go through the methods below which
+# keep the occupancy grid in sync
 @dataclass
 class Level:
     matrix: Matrix
@@ -79,16 +155,147 @@ class Level:
     items: List[LevelItem] = field(default_factory=list)
     board: Optional[Board] = None
     enemies: List[AIActor] = field(default_factory=list)
+    config: GenConfig = field(default_factory=GenConfig)
+    # room of each cell (an index of `rooms`), corridors are numbered
+    # after the rooms in `matrix` order, NO_ROOM elsewhere
+    room_ids: array = field(
+        default_factory=lambda: array("H"), repr=False, compare=False
+    )
+    # generation attempts and seconds spent per stage
+    stats: Dict[str, float] = field(
+        default_factory=dict, repr=False, compare=False
+    )
+    _occupancy: Optional[Occupancy] = field(
+        default=None, repr=False, compare=False
+    )
 
+    @property
+    def grid(self) -> Board:
+        assert self.board is not None, "the level has no board yet"
+        return self.board
 
+    @property
+    def occupancy(self) -> Occupancy:
+        if self._occupancy is None:
+            self._occupancy = Occupancy()
+            for e in self.enemies:
+                self._occupancy.add_actor(e, self.grid.to_index(*e.square))
+            for i in self.items:
+                self._occupancy.add_item(i, self.grid.to_index(*i.square))
+        return self._occupancy
+
+    def add_enemy(self, enemy: AIActor):
+        self.enemies.append(enemy)
+        self.occupancy.add_actor(enemy, self.grid.to_index(*enemy.square))
+
+    # it may already be gone, see Necromancer.hurt
+    def remove_enemy(self, enemy: AIActor):
+        if self.occupancy.has_actor(enemy):
+            self.enemies.remove(enemy)
+            self.occupancy.remove_actor(enemy)
+
+    # the square is reserved even while tweening to it
+    def move_enemy(self, enemy: AIActor, square: GridCoord):
+        self.occupancy.add_actor(enemy, self.grid.to_index(*square))
+
+    def add_item(self, item: LevelItem):
+        self.items.append(item)
+        self.occupancy.add_item(item, self.grid.to_index(*item.square))
+
+    def remove_item(self, item: LevelItem):
+        self.items.remove(item)
+        self.occupancy.remove_item(self.grid.to_index(*item.square))
+
+    def actor_at(self, x, y) -> Optional[AIActor]:
+        if self.grid.outside(x, y):
+            return None
+        return self.occupancy.actors.get(self.grid.to_index(x, y))
+
+    def item_at(self, x, y) -> Optional[LevelItem]:
+        if self.grid.outside(x, y):
+            return None
+        return self.occupancy.items.get(self.grid.to_index(x, y))
+
+    # room or corridor id, None outside of them
+    def room_at(self, x, y) -> Optional[int]:
+        if self.grid.outside(x, y):
+            return None
+        room = self.room_ids[self.grid.to_index(x, y)]
+        return None if room == NO_ROOM else room
+
+    # x, y, width, height
+    def room_bounds(self, room: int) -> Tuple[int, int, int, int]:
+        (w, h), _ = self.rooms[room]
+        return (*self.config.room_anchor(room), w, h)
+
+    def free_cells(self, room: int) -> List[GridCoord]:
+        x0, y0, w, h = self.room_bounds(room)
+        side, cells = self.grid.side, self.grid.cells
+        occupancy = self.occupancy
+        return [
+            (i % side, y)
+            for y in range(y0, y0 + h)
+            for i in range(y * side + x0, y * side + x0 + w)
+            if self.room_ids[i] == room
+            and TILE_FLAGS[cells[i]] & T_EMPTY
+            and i not in occupancy.actors
+            and i not in occupancy.items
+        ]
+
+    def enemies_near(self, square: GridCoord, reach: int) -> List[AIActor]:
+        """Enemies within `reach` squares of `square` on both axes"""
+        actors = self.occupancy.actors
+        side = self.grid.side
+        x, y = square
+        x0, x1 = max(x - reach, 0), min(x + reach, side - 1)
+        y0, y1 = max(y - reach, 0), min(y + reach, side - 1)
+        # look the squares up when there are fewer of them than enemies
+        if (x1 - x0 + 1) * (y1 - y0 + 1) < len(actors):
+            return [
+                actors[i]
+                for row in range(y0, y1 + 1)
+                for i in range(row * side + x0, row * side + x1 + 1)
+                if i in actors
+            ]
+        return [
+            actors[i]
+            for i in sorted(actors)
+            if x0 <= i % side <= x1 and y0 <= i // side <= y1
+        ]
+
+
+# writes bump the revision and are logged (see changes_since), stairs
+# and holes are indexed as they are written (see where)
 @dataclass
 class Board:
-    cells: List[int]
+    cells: bytearray
     side: int
     entrance: int = 0
+    revision: int = 0
+    max_log = 4096
+
+    _log: List[int] = field(default_factory=list, repr=False, compare=False)
+    _log_start: int = field(default=0, repr=False, compare=False)
+    # data computed from the cells (see rogue.graph.board_graph)
+    derived: Dict[Any, Any] = field(
+        default_factory=dict, repr=False, compare=False
+    )
+    _special: Dict[int, Set[int]] = field(
+        default_factory=dict, repr=False, compare=False
+    )
+
+    def __post_init__(self):
+        self._log_start = self.revision
+        self._index_special()
+
+    def _index_special(self):
+        self._special = {}
+        special = self.cells.translate(SPECIAL_TABLE)
+        for i in compress(range(len(self.cells)), special):
+            self._special.setdefault(self.cells[i], set()).add(i)
 
     def set(self, x, y, val):
-        self.cells[int(y) * self.side + int(x)] = val
+        self[int(y) * self.side + int(x)] = val
 
     def get(self, x, y):
         return self.cells[int(y) * self.side + int(x)]
@@ -97,7 +304,44 @@ class Board:
         return self.cells[k]
 
     def __setitem__(self, k, val):
-        self.cells[k] = val
+        old, self.cells[k] = self.cells[k], val
+        if SPECIAL_TABLE[old] or SPECIAL_TABLE[val]:
+            self._special.get(old, set()).discard(k)
+            if SPECIAL_TABLE[val]:
+                self._special.setdefault(val, set()).add(k)
+        self.revision += 1
+        self._log.append(k)
+        if len(self._log) > self.max_log:
+            drop = len(self._log) // 2
+            del self._log[:drop]
+            self._log_start += drop
+
+    # all the cells at once, as a single revision
+    def load(self, cells):
+        self.cells[:] = cells
+        self._index_special()
+        self.revision += 1
+        self._log.clear()
+        self._log_start = self.revision
+
+    def changes_since(self, revision: int) -> Optional[Set[int]]:
+        """Indices written after `revision`, None if not logged"""
+        if revision < self._log_start:
+            return None
+        return set(self._log[revision - self._log_start :])
+
+    def where(self, val: int) -> Set[int]:
+        if not SPECIAL_TABLE[val]:
+            raise ValueError(f"tile {val} is not indexed")
+        return set(self._special.get(val, ()))
+
+    def where_flags(self, flags: int) -> Set[int]:
+        return {
+            i
+            for val, indices in self._special.items()
+            if TILE_FLAGS[val] & flags
+            for i in indices
+        }
 
     def __len__(self):
         return len(self.cells)
@@ -119,6 +363,83 @@ class Board:
         ]
 
 
+class CellSet:
+    """Squares of a `side` x `side` board, one byte each"""
+
+    def __init__(self, side=0, squares=()):
+        self.side = side
+        self.bits = bytearray(side * side)
+        self.update(squares)
+
+    def _index(self, square):
+        x, y = map(int, square)
+        if x < 0 or y < 0 or x >= self.side or y >= self.side:
+            return None
+        return y * self.side + x
+
+    def add(self, square):
+        i = self._index(square)
+        if i is not None:
+            self.bits[i] = 1
+
+    def add_index(self, i):
+        self.bits[i] = 1
+
+    def update(self, squares):
+        if isinstance(squares, CellSet):
+            self |= squares
+            return
+        for square in squares:
+            self.add(square)
+
+    def clear(self):
+        self.bits = bytearray(self.side * self.side)
+
+    def indices(self):
+        return compress(range(len(self.bits)), self.bits)
+
+    def __contains__(self, square):
+        i = self._index(square)
+        return i is not None and self.bits[i] != 0
+
+    def window(self, x0, y0, w, h):
+        x1, y1 = min(x0 + w, self.side), min(y0 + h, self.side)
+        x0, y0 = max(x0, 0), max(y0, 0)
+        for y in range(y0, y1):
+            row = y * self.side
+            for x in compress(range(x0, x1), self.bits[row + x0 : row + x1]):
+                yield x, y
+
+    def __iter__(self):
+        side = self.side
+        return ((i % side, i // side) for i in self.indices())
+
+    def __len__(self):
+        return len(self.bits) - self.bits.count(0)
+
+    def __bool__(self):
+        return any(self.bits)
+
+    def __ior__(self, other):
+        if not isinstance(other, CellSet):
+            self.update(other)
+            return self
+        if other.side != self.side:
+            raise ValueError("cannot merge cell sets of different sides")
+        n = len(self.bits)
+        merged = int.from_bytes(self.bits, "little") | int.from_bytes(
+            other.bits, "little"
+        )
+        self.bits = bytearray(merged.to_bytes(n, "little"))
+        return self
+
+    def __or__(self, other):
+        res = CellSet(self.side)
+        res.bits[:] = self.bits
+        res |= other
+        return res
+
+
 class Actor:
     parent = None
     _orient = LEFT
@@ -210,6 +531,9 @@ class Actor:
 
 class AIActor(Actor):
     zindex = 0
+    # after the player, see State.hunt
+    hunting = False
+
     def take_action(self, state: State, end_turn) -> ActionReport:
         end_turn(self)
         return None
@@ -231,6 +555,10 @@ class AnimSprite:
         i = (self._start // self.rate) % self.count
         return self.uvs[i]
 
+    @property
+    def playing(self) -> bool:
+        return self._playing
+
     def play(self):
         self._playing = True
 
@@ -254,29 +582,40 @@ class Tool:
 @dataclass
 class State:
     max_range = 5
+    # enemies further away than that (on either axis) are left idle, it
+    # covers all the squares within reach of the chase map
+    active_range = max_range * 3
     player: Actor
-    levels: List[Level]
+    # floors other than the current one may be frozen, or None when they
+    # are not generated yet or kept on disk (see rogue.descent)
+    levels: List[Optional[Union[Level, FrozenLevel]]]
     current_level: int
     camera: Tuple[float, float]
-    in_range: Set[Any] = field(default_factory=set)
-    visible: Set[GridCoord] = field(default_factory=set)
+    visible: CellSet = field(default_factory=CellSet)
     particles: List[Particle] = field(default_factory=list)
     player_turn: bool = True
     menu_index: Optional[int] = None
     active_tool: Optional[Tool] = None
     text_box: Optional[Any] = None
-    visited_by_floor: Set[GridCoord] = field(default_factory=list)
-    occupied: Set[GridCoord] = field(default_factory=set)
+    visited_by_floor: List[Optional[CellSet]] = field(default_factory=list)
+    fov_key: Optional[Tuple[int, GridCoord, int]] = None
+    fov_engine: str = "table"
+    # chasers keep after the player out of sight, as long as they're awake
+    hunt: bool = False
+    chase_map: Dict[int, int] = field(default_factory=dict)
+    chase_key: Optional[Tuple[int, GridCoord, int]] = None
+    # enemies taking part in the current enemy turn
+    awake: List[AIActor] = field(default_factory=list)
+    # called with the index of the floor about to be entered
+    level_listeners: List[Callable[[State, int], None]] = field(
+        default_factory=list, repr=False
+    )
 
     def get_entity(self, x, y):
-        pos = x, y
-        for e in self.enemies:
-            if e.square == pos:
-                return e
-        for i in self.level.items:
-            if i.square == pos:
-                return i
-        if  self.player.square == pos:
+        entity = self.level.actor_at(x, y) or self.level.item_at(x, y)
+        if entity is not None:
+            return entity
+        if self.player.square == (x, y):
             return self.player
 
         return None
@@ -290,8 +629,10 @@ class State:
         return tuple(int(c * tile_size) for c in self.to_cam_space(pos))
 
     @property
-    def level(self):
-        return self.levels[self.current_level]
+    def level(self) -> Level:
+        level = self.levels[self.current_level]
+        assert isinstance(level, Level), "the current floor is not thawed"
+        return level
 
     @property
     def board(self):
@@ -306,22 +647,29 @@ class State:
         self.level.enemies = val
 
     @property
-    def visited(self):
-        return self.visited_by_floor[self.current_level]
+    def visited(self) -> CellSet:
+        visited = self.visited_by_floor[self.current_level]
+        assert visited is not None, "the current floor is not thawed"
+        return visited
 
     @visited.setter
     def visited(self, val):
         self.visited_by_floor[self.current_level] = val
 
+    def nearby_enemies(self) -> List[AIActor]:
+        return self.level.enemies_near(self.player.square, self.active_range)
+
     def change_level(self, offset):
+        for listener in self.level_listeners:
+            listener(self, self.current_level + offset)
         self.current_level += offset
+        self.awake = []
         if offset > 0:
             self.player.pos = self.board.to_pos(self.board.entrance)
         elif offset < 0:
-            for i in range(len(self.board)):
-                if self.board[i] == 99:
-                    break
-            self.player.pos = self.board.to_pos(i)
+            # back on the stairs down, or at the entrance if there are none
+            down = min(self.board.where(DOWN), default=self.board.entrance)
+            self.player.pos = self.board.to_pos(down)
 
 MenuItem = Tuple[str, Callable[[State], None]]
 
@@ -337,28 +685,58 @@ class Particle:
         raise NotImplementedError
 
 
+# tile predicates, as bit flags of TILE_FLAGS[tile]
+T_WALL, T_DOOR, T_LOCKED, T_EMPTY, T_HOLE, T_ACTIVE = 1, 2, 4, 8, 16, 32
+
+
+def _tile_flags(val: int) -> int:
+    flags = 0
+    if val == 1 or WALL_BASE <= val < WALL_BASE + 16:
+        flags |= T_WALL
+    if val == 2 or 20 <= val < 30:
+        flags |= T_DOOR
+    if 25 <= val < 30:
+        flags |= T_LOCKED
+    if val == 0 or 30 <= val < 40 or val in {UP, DOWN}:
+        flags |= T_EMPTY
+    if 40 <= val < 45:
+        flags |= T_HOLE
+    if val in {UP, DOWN}:
+        flags |= T_ACTIVE
+    return flags
+
+
+TILE_FLAGS = bytes(_tile_flags(val) for val in range(256))
+
+# tiles whose cells are indexed by the boards (see Board.where)
+SPECIAL_TILES = T_ACTIVE | T_HOLE
+SPECIAL_TABLE = bytes(
+    TILE_FLAGS[val] & SPECIAL_TILES != 0 for val in range(256)
+)
+
+
 def is_wall(val: int) -> bool:
-    return val in WALLS or val == 1
+    return TILE_FLAGS[val] & T_WALL != 0
 
 
 def is_door(val: int) -> bool:
-    return val == 2 or 20 <= val < 30
+    return TILE_FLAGS[val] & T_DOOR != 0
 
 
 def is_locked(val: int) -> bool:
-    return 25 <= val < 30
+    return TILE_FLAGS[val] & T_LOCKED != 0
 
 
 def is_empty(val: int) -> bool:
-    return val == 0 or 30 <= val < 40 or val == 99 or val == 66
+    return TILE_FLAGS[val] & T_EMPTY != 0
 
 
 def is_active_tile(val) -> bool:
-    return val in {66, 99}
+    return TILE_FLAGS[val] & T_ACTIVE != 0
 
 
 def is_hole(val: int) -> bool:
-    return 40 <= val < 45
+    return TILE_FLAGS[val] & T_HOLE != 0
 
 
 def index_to_pos(index: int, width: int) -> GridCoord:
@@ -470,3 +848,184 @@ def cast_ray(
             traversed.append((map_x, map_y))
 
     return traversed, hit, side
+
+
+def is_opaque(val: int) -> bool:
+    return TILE_FLAGS[val] & (T_WALL | T_DOOR) != 0
+
+
+def blocks_sight(board: Board, origin: GridCoord, max_range, x, y) -> bool:
+    return (
+        board.outside(x, y)
+        or is_wall(board.get(x, y))
+        or dist(origin, (x, y)) > max_range
+        or is_door(board.get(x, y))
+    )
+
+
+# squares crossed by rays toward the edge midpoints of the squares in
+# range, with the squares that stop them
+def ray_fov(board: Board, origin: GridCoord, max_range) -> CellSet:
+    px, py = origin
+    reach = max_range * 2
+    in_range = []
+    for y in range(max(py - reach, 0), min(py + reach + 1, board.side)):
+        for x in range(max(px - reach, 0), min(px + reach + 1, board.side)):
+            if dist((x + 0.5, y + 0.5), origin) < reach:
+                in_range.append(board.to_index(x, y))
+
+    def ray_dirs(i):
+        c, r = index_to_pos(i, board.side)
+        return [
+            (x - px, y - py)
+            for x, y in [
+                (c + 0.5, r),
+                (c + 1, r + 0.5),
+                (c + 0.5, r + 1),
+                (c, r + 0.5),
+            ]
+            if x - px and y - py
+        ]
+
+    def hit_wall(x, y):
+        return blocks_sight(board, origin, max_range, x, y)
+
+    rays: List[VecF] = sum([ray_dirs(i) for i in in_range], [])
+    visible = CellSet(board.side)
+    for r in rays:
+        trav, hit, _ = cast_ray((px + 0.5, py + 0.5), r, hit_wall)
+        visible.update(trav)
+        if not board.outside(*hit):
+            visible.add(hit)
+    return visible
+
+
+# (x, y) = origin + row * (rx, ry) + col * (cx, cy), one per cardinal quadrant
+QUADRANTS = [(0, -1, 1, 0), (1, 0, 0, 1), (0, 1, 1, 0), (-1, 0, 0, 1)]
+
+
+def shadowcast_fov(board: Board, origin: GridCoord, max_range) -> CellSet:
+    """Shadowcasting over the rays of `ray_fov`, seeing the same squares"""
+    ox, oy = origin
+    reach = max_range * 2
+    visible = CellSet(board.side, [origin])
+
+    # the same fan as ray_fov, aimed from the origin square's corner
+    fan = []
+    for y in range(max(oy - reach, 0), min(oy + reach + 1, board.side)):
+        for x in range(max(ox - reach, 0), min(ox + reach + 1, board.side)):
+            if dist((x + 0.5, y + 0.5), origin) < reach:
+                for u, v in [
+                    (x + 0.5, y),
+                    (x + 1, y + 0.5),
+                    (x + 0.5, y + 1),
+                    (x, y + 0.5),
+                ]:
+                    if u - ox and v - oy:
+                        fan.append((u - ox, v - oy))
+
+    for rx, ry, cx, cy in QUADRANTS:
+        slopes = []
+        for u, v in fan:
+            depth, col = u * rx + v * ry, u * cx + v * cy
+            if abs(col) < depth:
+                slopes.append(col / depth)
+        slopes.sort()
+        live = bytearray([1]) * len(slopes)
+
+        depth = 0
+        while live.find(1) >= 0:
+            depth += 1
+            near, far = depth - 0.5, depth + 0.5
+            # rays cross a row from the axis outward, blockers drop theirs
+            for col in chain(range(depth + 1), range(-1, -depth - 1, -1)):
+                lo = (col - 0.5) / (far if col > 0 else near)
+                hi = (col + 0.5) / (near if col >= 0 else far)
+                i, j = bisect_right(slopes, lo), bisect_left(slopes, hi)
+                if live.find(1, i, j) < 0:
+                    continue
+                x = ox + depth * rx + col * cx
+                y = oy + depth * ry + col * cy
+                if not board.outside(x, y):
+                    visible.add((x, y))
+                if blocks_sight(board, origin, max_range, x, y):
+                    live[i:j] = bytes(j - i)
+
+    return visible
+
+
+# the rays of ray_fov as a prefix tree, flattened depth first into
+# (dx, dy, skip) entries, skip being the index after the subtree
+def build_los_table(max_range) -> List[Tuple[int, int, int]]:
+    reach = max_range * 2
+
+    def out_of_range(x, y):
+        return dist((0, 0), (x, y)) > max_range
+
+    tree: dict = {}
+    for c in range(-reach - 1, reach + 1):
+        for r in range(-reach - 1, reach + 1):
+            if dist((c + 0.5, r + 0.5), (0, 0)) >= reach:
+                continue
+            for x, y in [
+                (c + 0.5, r),
+                (c + 1, r + 0.5),
+                (c + 0.5, r + 1),
+                (c, r + 0.5),
+            ]:
+                if not x or not y:
+                    continue
+                trav, hit, _ = cast_ray((0.5, 0.5), (x, y), out_of_range)
+                node = tree
+                for square in trav[1:] + [hit]:
+                    node = node.setdefault(square, {})
+
+    table: List[Tuple[int, int, int]] = []
+
+    def flatten(node):
+        for (dx, dy), children in node.items():
+            i = len(table)
+            table.append((dx, dy, 0))
+            flatten(children)
+            table[i] = dx, dy, len(table)
+
+    flatten(tree)
+    return table
+
+
+LOS_TABLES: dict = {}
+
+
+def table_fov(board: Board, origin: GridCoord, max_range) -> CellSet:
+    """Same as `ray_fov`, walking the rays of `build_los_table`"""
+    table = LOS_TABLES.get(max_range)
+    if table is None:
+        table = LOS_TABLES[max_range] = build_los_table(max_range)
+
+    ox, oy = origin
+    side = board.side
+    cells = board.cells
+    visible = CellSet(side, [origin])
+    i, n = 0, len(table)
+    while i < n:
+        dx, dy, skip = table[i]
+        x, y = ox + dx, oy + dy
+        if x < 0 or y < 0 or x >= side or y >= side:
+            i = skip
+            continue
+        index = y * side + x
+        visible.add_index(index)
+        if dx * dx + dy * dy > max_range * max_range or is_opaque(
+            cells[index]
+        ):
+            i = skip
+        else:
+            i += 1
+    return visible
+
+
+FOV_ENGINES = {
+    "table": table_fov,
+    "rays": ray_fov,
+    "shadowcast": shadowcast_fov,
+}
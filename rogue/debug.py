@@ -1,9 +1,8 @@
 import pyxel
 
-from rogue.core import index_to_pos, State
+from rogue.core import index_to_pos, is_hole, State
 from rogue.dungeon_gen import (
-    M_SIZE,
-    MAX_ROOM_SIZE,
+    room_anchor,
     is_wall,
     is_door,
     is_locked,
@@ -11,18 +10,32 @@ from rogue.dungeon_gen import (
 
 U = 3
 OFF = 4
+# squares shown on each axis, around the player on bigger boards
+SPAN = 40
 
 
 def update_debug(state: State):
     pass
 
 
+def window_origin(state: State):
+    side = state.board.side
+    if side <= SPAN:
+        return 0, 0
+    px, py = state.player.square
+    return (
+        min(max(px - SPAN // 2, 0), side - SPAN),
+        min(max(py - SPAN // 2, 0), side - SPAN),
+    )
+
+
 def outline_room(state, room_index, color):
-    x, y = index_to_pos(room_index, M_SIZE)
+    wx, wy = window_origin(state)
+    x, y = room_anchor(room_index, state.level.config)
     size = state.level.rooms[room_index][0]
     pyxel.rectb(
-        x * U * MAX_ROOM_SIZE + OFF,
-        y * U * MAX_ROOM_SIZE + OFF,
+        (x - wx) * U + OFF,
+        (y - wy) * U + OFF,
         size[0] * U,
         size[1] * U,
         color,
@@ -32,8 +45,11 @@ def outline_room(state, room_index, color):
 
 def draw_debug(state: State, *extras):
     pyxel.cls(0)
-    for i in range(len(state.board)):
-        x, y = index_to_pos(i, state.board.side)
+    wx, wy = window_origin(state)
+    span = min(SPAN, state.board.side)
+    for j in range(span * span):
+        x, y = index_to_pos(j, span)
+        i = state.board.to_index(wx + x, wy + y)
 
         v = state.board[i]
         if is_wall(v):
@@ -43,7 +59,7 @@ def draw_debug(state: State, *extras):
                 col = 8
             else:
                 col = 13
-        elif 40 <= v <45:
+        elif is_hole(v):
             col = 1
         elif state.board.entrance == i:
             col = 12
@@ -55,7 +71,10 @@ def draw_debug(state: State, *extras):
 
     for i in state.level.items:
         x, y = i.square
-        pyxel.rect(x * U + OFF, y * U + 1 + OFF, U, U, 9)
+        pyxel.rect((x - wx) * U + OFF, (y - wy) * U + 1 + OFF, U, U, 9)
+
+    if not state.level.rooms:
+        return  # caves
 
     outline_room(state, state.level.start_room, 12)
     outline_room(state, state.level.final_rooms[0], 14)
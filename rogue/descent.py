@@ -0,0 +1,129 @@
+# endless descent: the next floor is generated in a worker as soon as a
+# floor is entered, the floors left `keep` levels behind go to disk
+
+import os
+import tempfile
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Dict, List, Optional, Set
+
+from rogue.core import GenConfig, State
+from rogue.dungeon_gen import DEFAULT_CONFIG, Seed, make_rng
+from rogue.levelcache import LevelCache
+from rogue.levelpack import (
+    FrozenLevel,
+    build_floor,
+    freeze,
+    freeze_pack,
+)
+
+# floor types after the first floor, in turn
+ENDLESS_FLOORS = ["level_2", "cave"]
+KEEP_BEHIND = 2
+
+
+def floor_kind(n: int) -> str:
+    if n == 0:
+        return "level_1"
+    return ENDLESS_FLOORS[(n - 1) % len(ENDLESS_FLOORS)]
+
+
+class Descent:
+    def __init__(
+        self,
+        config: GenConfig = DEFAULT_CONFIG,
+        seed: Seed = None,
+        cache: Optional[LevelCache] = None,
+        keep: int = KEEP_BEHIND,
+    ):
+        self.config = config
+        self.keep = keep
+        self._rng = make_rng(seed)
+        # same seeds as floor_seeds(seed, n), drawn as the floors come
+        self._seeds: List[int] = []
+        self._fetch = build_floor if cache is None else cache.fetch
+        self._pool = ProcessPoolExecutor(1)
+        self._ahead: Dict[int, Future] = {}
+        self._loaded: Set[int] = set()
+        self._evicted: Set[int] = set()
+        self._dir = tempfile.TemporaryDirectory(prefix="rogue-")
+        self.prefetch(0)
+
+    def seed(self, n: int) -> int:
+        while len(self._seeds) <= n:
+            self._seeds.append(self._rng.getrandbits(64))
+        return self._seeds[n]
+
+    def prefetch(self, n: int):
+        if n in self._ahead or n in self._loaded or n in self._evicted:
+            return
+        kind = floor_kind(n)
+        self._ahead[n] = self._pool.submit(
+            self._fetch, kind, self.config, self.seed(n)
+        )
+
+    def ready(self) -> bool:
+        return self._ahead[0].done() if 0 in self._ahead else True
+
+    # the floors come frozen, swap_floors must listen after this
+    def attach(self, state: State):
+        state.levels = []
+        state.visited_by_floor = []
+        state.level_listeners.append(self.enter)
+
+    def enter(self, state: State, n: int):
+        levels, visited = state.levels, state.visited_by_floor
+        while len(levels) <= n:
+            levels.append(None)
+            visited.append(None)
+
+        for i in sorted(self._loaded):
+            if i < n - self.keep or i > n + 1:
+                self._evict(state, i)
+
+        if n not in self._loaded:
+            if n in self._evicted:
+                self._reload(state, n)
+            else:
+                self.prefetch(n)
+                # only waits if the player went down faster than the worker
+                levels[n] = freeze_pack(self._ahead.pop(n).result())
+            self._loaded.add(n)
+
+        self.prefetch(n + 1)
+
+    def close(self):
+        for future in self._ahead.values():
+            future.cancel()
+        self._pool.shutdown(wait=False)
+        self._dir.cleanup()
+
+    def _path(self, n: int, ext: str) -> str:
+        return os.path.join(self._dir.name, f"{n}.{ext}")
+
+    def _evict(self, state: State, n: int):
+        level = state.levels[n]
+        if isinstance(level, FrozenLevel):
+            frozen = level
+        elif level is not None:
+            frozen = freeze(level, state.visited_by_floor[n])
+        else:
+            raise ValueError(f"floor {n} is not in memory")
+        with open(self._path(n, "lvl"), "wb") as f:
+            f.write(frozen.pack)
+        if frozen.visited is not None:
+            with open(self._path(n, "seen"), "wb") as f:
+                f.write(frozen.visited)
+        state.levels[n] = None
+        state.visited_by_floor[n] = None
+        self._loaded.discard(n)
+        self._evicted.add(n)
+
+    def _reload(self, state: State, n: int):
+        with open(self._path(n, "lvl"), "rb") as f:
+            pack = f.read()
+        visited = None
+        if os.path.exists(self._path(n, "seen")):
+            with open(self._path(n, "seen"), "rb") as f:
+                visited = f.read()
+        state.levels[n] = FrozenLevel(pack, visited)
+        self._evicted.discard(n)
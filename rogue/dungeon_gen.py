@@ -1,6 +1,19 @@
-from functools import partial
 import random
-from typing import List, Tuple
+from array import array
+from contextlib import contextmanager
+from itertools import compress
+from math import log
+from time import perf_counter
+from typing import (
+    AbstractSet,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+)
 from rogue.items import (
     Chest,
     ADD_KEY,
@@ -14,9 +27,9 @@ from rogue.items import (
 )
 from rogue.graph import (
     neighbours_map,
-    find_paths,
-    extract_path,
-    board_neighbours,
+    search,
+    board_graph,
+    PathTree,
 )
 
 from rogue.core import (
@@ -24,39 +37,74 @@ from rogue.core import (
     is_empty,
     is_locked,
     is_wall,
-    is_active_tile,
+    TILE_FLAGS,
+    T_ACTIVE,
+    T_EMPTY,
 )
 from rogue.core import (
     index_to_pos,
     Board,
+    GenConfig,
     AIActor,
     pos_to_index,
     Level,
+    NO_ROOM,
     Matrix,
     MPath,
     Room,
     Position,
 )
 
+from rogue.constants import WALL_BASE
 from rogue.enemies import Slug, Skeleton, Ghost, Plant, Bat, Necromancer
 
 M_SIZE = 4
 MAX_ROOM_SIZE = 8
 SIDE = M_SIZE * MAX_ROOM_SIZE
+DEFAULT_CONFIG = GenConfig(M_SIZE, MAX_ROOM_SIZE)
+# final rooms are bigger than 5x5 (see pick_final_rooms)
+FINAL_MIN_SIZE = 6
+
+# an integer seed, a generator to draw from, or None for a random one
+Seed = Union[int, random.Random, None]
+
+
+def make_rng(seed: Seed = None) -> random.Random:
+    if isinstance(seed, random.Random):
+        return seed
+    return random.Random(seed)
+
+
+@contextmanager
+def timed(stats: Dict[str, float], stage: str):
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        stats[stage] = stats.get(stage, 0) + perf_counter() - start
+
 
+# one seed per floor, so each can be generated on its own
+def floor_seeds(seed: Seed, n: int) -> List[int]:
+    rng = make_rng(seed)
+    return [rng.getrandbits(64) for _ in range(n)]
 
-def matrix_neighbours(index: int) -> List[int]:
-    col, row = index_to_pos(index, M_SIZE)
+
+def matrix_neighbours(
+    index: int, config: GenConfig = DEFAULT_CONFIG
+) -> List[int]:
+    m_size = config.m_size
+    col, row = index_to_pos(index, m_size)
 
     return [
-        r * M_SIZE + c
+        r * m_size + c
         for r, c in [
             (row, col + 1),
             (row + 1, col),
             (row, col - 1),
             (row - 1, col),
         ]
-        if r < M_SIZE and c < M_SIZE and r >= 0 and c >= 0
+        if r < m_size and c < m_size and r >= 0 and c >= 0
     ]
 
 
@@ -64,33 +112,57 @@ def count_neighbours(matrix: Matrix, index: int) -> int:
     return sum(1 for a, b in matrix if a == index or b == index)
 
 
-def dig_matrix(start) -> Matrix:
+def dig_matrix(
+    start,
+    rng: random.Random,
+    config: GenConfig = DEFAULT_CONFIG,
+    blocked: AbstractSet[int] = frozenset(),
+) -> Matrix:
     matrix: Matrix = []
     visited = {start}
-    to_explore = set(matrix_neighbours(start))
+    to_explore = set(matrix_neighbours(start, config))
+    to_explore.difference_update(blocked)
     while to_explore:
-        start = random.choice(list(to_explore))
-        old = next(n for n in visited if n in matrix_neighbours(start))
+        start = rng.choice(list(to_explore))
+        neighs = matrix_neighbours(start, config)
+        old = next(n for n in visited if n in neighs)
         matrix.append((old, start))
         visited.add(start)
         to_explore.remove(start)
         to_explore |= set(
-            n for n in matrix_neighbours(start) if n not in visited
+            n for n in neighs if n not in visited and n not in blocked
         )
 
     return matrix
 
 
-def add_loops(matrix: Matrix) -> Matrix:
-    extras = random.randrange(int(M_SIZE / 2), M_SIZE)
-    goal = extras + len(matrix)
+def add_loops(
+    matrix: Matrix,
+    rng: random.Random,
+    config: GenConfig = DEFAULT_CONFIG,
+    blocked: AbstractSet[int] = frozenset(),
+) -> Matrix:
+    extras = rng.randrange(int(config.m_size / 2), config.m_size)
+    free = [i for i in range(config.n_rooms) if i not in blocked]
+    # the matrix can't get more paths than there are adjacent rooms
+    edges = sum(
+        1
+        for a in free
+        for b in matrix_neighbours(a, config)
+        if b > a and b not in blocked
+    )
+    goal = min(extras + len(matrix), edges)
     while len(matrix) < goal:
-        a = random.randrange(M_SIZE * M_SIZE)
+        a = rng.randrange(config.n_rooms)
+        if a in blocked:
+            continue
         try:
             b = next(
                 b
-                for b in matrix_neighbours(a)
-                if (a, b) not in matrix and (b, a) not in matrix
+                for b in matrix_neighbours(a, config)
+                if (a, b) not in matrix
+                and (b, a) not in matrix
+                and b not in blocked
             )
         except StopIteration:
             continue
@@ -100,15 +172,32 @@ def add_loops(matrix: Matrix) -> Matrix:
     return matrix
 
 
-def random_room(matrix: Matrix, room_index: int) -> Room:
+# final rooms and their left and top neighbours are sized to pass
+# pick_final_rooms
+def random_room(
+    matrix: Matrix,
+    room_index: int,
+    rng: random.Random,
+    config: GenConfig = DEFAULT_CONFIG,
+    final_rooms: Sequence[int] = (),
+) -> Room:
     n_neigh = count_neighbours(matrix, room_index)
     threshold = 4
     min_size = 3 if n_neigh > 1 else threshold
 
-    max_size = MAX_ROOM_SIZE - 0
+    max_size = config.max_room_size - 0
+    max_w = max_h = max_size
+    if room_index in final_rooms:
+        min_size = FINAL_MIN_SIZE
+        max_w = max_h = max_size - 1
+    if room_index % config.m_size < config.m_size - 1:
+        if room_index + 1 in final_rooms:
+            max_w = max_size - 1
+    if room_index + config.m_size in final_rooms:
+        max_h = max_size - 1
     w, h = (
-        random.randint(min_size, max_size),
-        random.randint(min_size, max_size),
+        rng.randint(min_size, max_w),
+        rng.randint(min_size, max_h),
     )
 
     if w < threshold or h < threshold:
@@ -117,9 +206,56 @@ def random_room(matrix: Matrix, room_index: int) -> Room:
     return (w, h), (0, 0)
 
 
-def create_matrix() -> Matrix:
-    start = random.randrange(M_SIZE * M_SIZE)
-    return add_loops(dig_matrix(start))
+# final rooms are left out of the maze, then attached as dead ends
+def create_matrix(
+    rng: random.Random,
+    config: GenConfig = DEFAULT_CONFIG,
+    final_rooms: Sequence[int] = (),
+) -> Matrix:
+    if not final_rooms:
+        start = rng.randrange(config.n_rooms)
+        return add_loops(dig_matrix(start, rng, config), rng, config)
+
+    blocked = set(final_rooms)
+    start = rng.choice([i for i in range(config.n_rooms) if i not in blocked])
+    matrix = dig_matrix(start, rng, config, blocked)
+    matrix = add_loops(matrix, rng, config, blocked)
+    for final in final_rooms:
+        neighs = matrix_neighbours(final, config)
+        anchor = rng.choice([n for n in neighs if n not in blocked])
+        matrix.append((anchor, final))
+    return matrix
+
+
+def _connected(cells: Set[int], config: GenConfig) -> bool:
+    if not cells:
+        return True
+    start = next(iter(cells))
+    seen, todo = {start}, [start]
+    while todo:
+        for n in matrix_neighbours(todo.pop(), config):
+            if n in cells and n not in seen:
+                seen.add(n)
+                todo.append(n)
+    return len(seen) == len(cells)
+
+
+# 3 rooms, none next to another, the other rooms still connected
+def place_final_rooms(rng: random.Random, config: GenConfig) -> List[int]:
+    if config.max_room_size <= FINAL_MIN_SIZE or config.m_size < 4:
+        raise ValueError(f"final rooms don't fit in {config}")
+    finals: List[int] = []
+    rest = set(range(config.n_rooms))
+    for _ in range(3):
+        near = set(finals)
+        for f in finals:
+            near.update(matrix_neighbours(f, config))
+        candidates = sorted(rest - near)
+        rng.shuffle(candidates)
+        final = next(i for i in candidates if _connected(rest - {i}, config))
+        finals.append(final)
+        rest.remove(final)
+    return sorted(finals)
 
 
 def carve_room(board: Board, room: Room, pos: Position) -> Board:
@@ -133,13 +269,20 @@ def carve_room(board: Board, room: Room, pos: Position) -> Board:
     return board
 
 
-def carve_path(board: Board, level: Level, path: MPath) -> Board:
+def carve_path(
+    board: Board,
+    level: Level,
+    path: MPath,
+    rng: random.Random,
+    corridor: int = NO_ROOM,
+) -> Board:
     a, b = path
     r1, r2 = level.rooms[a][0], level.rooms[b][0]
-    p1, p2 = list(room_anchor(a)), list(room_anchor(b))
+    p1 = list(room_anchor(a, level.config))
+    p2 = list(room_anchor(b, level.config))
     other = 0 if p1[0] == p2[0] else 1
     max_off = min(r1[other], r2[other])
-    off = random.randrange(max_off)
+    off = rng.randrange(max_off)
 
     p1[other] += off
     p2[other] += off
@@ -169,6 +312,7 @@ def carve_path(board: Board, level: Level, path: MPath) -> Board:
             val = 0
 
         board.set(x, y, val)
+        level.room_ids[board.to_index(x, y)] = corridor
         p[coord] += step
         cpt += 1
         last_i = x, y
@@ -179,18 +323,49 @@ def carve_path(board: Board, level: Level, path: MPath) -> Board:
         board.set(*last_i, 0)
 
     board.set(x, y, val)
+    level.room_ids[board.to_index(x, y)] = corridor
 
     return board
 
 
-def room_anchor(index: int) -> Position:
-    x = (index * MAX_ROOM_SIZE) % SIDE
-    y = int((index * MAX_ROOM_SIZE) / SIDE) * MAX_ROOM_SIZE
-    return x, y
+def room_anchor(index: int, config: GenConfig = DEFAULT_CONFIG) -> Position:
+    return config.room_anchor(index)
+
+
+# Level.room_ids before the corridors are carved
+def room_grid(level: Level) -> array:
+    side = level.config.side
+    room_ids = array("H", [NO_ROOM]) * (side * side)
+    for room in range(len(level.rooms)):
+        x, y, w, h = level.room_bounds(room)
+        ids = array("H", [room]) * w
+        for row in range(y, y + h):
+            room_ids[row * side + x : row * side + x + w] = ids
+    return room_ids
+
+
+# floor and door variants, indexed by the tile above them
+def _below_tables():
+    floor, door = bytearray([30]) * 256, bytearray([20]) * 256
+    for mask in range(16):
+        left, right = mask & 0b0001, mask & 0b0100
+        if left and right:
+            floor[WALL_BASE | mask], door[WALL_BASE | mask] = 32, 22
+        elif right:
+            floor[WALL_BASE | mask], door[WALL_BASE | mask] = 31, 21
+        elif left:
+            floor[WALL_BASE | mask], door[WALL_BASE | mask] = 33, 23
+        else:
+            floor[WALL_BASE | mask], door[WALL_BASE | mask] = 34, 23
+    floor[20] = 35  # front door
+    return bytes(floor), bytes(door)
+
+
+FLOOR_BELOW, DOOR_BELOW = _below_tables()
 
 
 def encode_wall(board: Board, index: int) -> int:
-    val = 0b10000
+    val = WALL_BASE
 
     x, y = index_to_pos(index, board.side)
     neighs = [(x - 1, y), (x, y + 1), (x + 1, y), (x, y - 1)]
@@ -199,58 +374,25 @@ def encode_wall(board: Board, index: int) -> int:
         if board.outside(x_, y_) or is_wall(board.get(x_, y_)):
             val = val | (1 << i)
 
-    return int("{0:b}".format(val))
+    return val
 
 
 def encode_floor(board: Board, index: int) -> int:
     x, y = index_to_pos(index, board.side)
-    top = x, y - 1
-
-    top_val = board.get(*top)
-
-    if board.outside(*top):
+    if board.outside(x, y - 1):
         return 32
-
-    elif is_wall(top_val):
-        bin_str = str(top_val)
-        if bin_str[4] == "0" and bin_str[2] == "1":
-            return 31
-        elif bin_str[4] == "1" and bin_str[2] == "1":
-            return 32
-        elif bin_str[4] == "1" and bin_str[2] == "0":
-            return 33
-        elif bin_str[4] == "0" and bin_str[2] == "0":
-            return 34
-
-    elif top_val == 20:  # front door
-        return 35
-
-    return 30
+    return FLOOR_BELOW[board.get(x, y - 1)]
 
 
 def encode_door(board: Board, index: int) -> int:
     x, y = index_to_pos(index, board.side)
-    top = x, y - 1
-
-    top_val = board.get(*top)
-
-    if board.outside(*top):
+    if board.outside(x, y - 1):
         return 22
-
-    elif is_wall(top_val):
-        bin_str = str(top_val)
-        if bin_str[4] == "0" and bin_str[2] == "1":
-            return 21
-        elif bin_str[4] == "1" and bin_str[2] == "1":
-            return 22
-        elif bin_str[2] == "0":
-            return 23
-
-    return 20
+    return DOOR_BELOW[board.get(x, y - 1)]
 
 
-def clean_board(board: Board) -> Board:
-
+# cell by cell clean_board, to test it against
+def clean_board_reference(board: Board) -> Board:
     for i in range(len(board)):
         val = board[i]
         if val == 1:
@@ -272,19 +414,92 @@ def clean_board(board: Board) -> Board:
     return board
 
 
-def create_board(level: Level):
+# Raw cells are 0 (floor), 1 (wall) or 2 (door)
+_IS_RAW = {
+    val: bytes(int(i == val) for i in range(256)) for val in (0, 1)
+}
+_LANE_MASKS: dict = {}
+
+
+# 0x01 in the cell bytes of the first/last column and row
+def _lane_masks(side):
+    if side not in _LANE_MASKS:
+        n = side * side
+        first_col = (b"\x01" + bytes(side - 1)) * side
+        last_col = (bytes(side - 1) + b"\x01") * side
+        first_row = b"\x01" * side + bytes(n - side)
+        last_row = bytes(n - side) + b"\x01" * side
+        _LANE_MASKS[side] = tuple(
+            int.from_bytes(m, "little")
+            for m in (first_col, last_col, first_row, last_row)
+        )
+    return _LANE_MASKS[side]
+
+
+def clean_board(board: Board) -> Board:
+    """Raw cells to tiles, whole board at once but for the doors"""
+    side, n = board.side, len(board)
+    ones, full = int.from_bytes(b"\x01" * n, "little"), (1 << 8 * n) - 1
+    first_col, last_col, first_row, last_row = _lane_masks(side)
+    raw = bytes(board.cells)
+
+    walls = int.from_bytes(raw.translate(_IS_RAW[1]), "little")
+    left = (walls << 8) & full & ~(first_col * 0xFF) | first_col
+    right = (walls >> 8) & ~(last_col * 0xFF) | last_col
+    bottom = (walls >> 8 * side) | last_row
+    top = (walls << 8 * side) & full | first_row
+    mask = left | bottom << 1 | right << 2 | top << 3
+    wall_lanes = walls * 0xFF
+    tiles = ((mask | ones * WALL_BASE) & wall_lanes) | (
+        int.from_bytes(raw, "little") & ~wall_lanes
+    )
+    cells = bytearray(tiles.to_bytes(n, "little"))
+
+    # must happen after walls (top down), a removed door counts as empty
+    door = raw.find(2)
+    while door != -1:
+        x, y = board.to_pos(door)
+        n_neigh = sum(
+            1 for k in board.neighbours(x, y) if cells[board.to_index(*k)] == 0
+        )
+        if n_neigh > 2:
+            cells[door] = 0  # remove door
+        elif y == 0:
+            cells[door] = 22
+        else:
+            cells[door] = DOOR_BELOW[cells[door - side]]
+        door = raw.find(2, door + 1)
+
+    # must happen after walls and doors
+    floors = bytes([32]) * side + bytes(cells[:-side]).translate(FLOOR_BELOW)
+    floor_lanes = int.from_bytes(raw.translate(_IS_RAW[0]), "little") * 0xFF
+    tiles = (int.from_bytes(floors, "little") & floor_lanes) | (
+        int.from_bytes(cells, "little") & ~floor_lanes
+    )
+
+    board.load(tiles.to_bytes(n, "little"))
+    return board
+
+
+def create_board(level: Level, rng: random.Random):
     # fully walls (+ border)
-    board = Board(cells=(SIDE * SIDE) * [1], side=SIDE,)
-    for i, room in enumerate(level.rooms):
-        board = carve_room(board, room, room_anchor(i))
+    side = level.config.side
+    board = Board(cells=bytearray([1]) * (side * side), side=side,)
+    with timed(level.stats, "carving"):
+        for i, room in enumerate(level.rooms):
+            board = carve_room(board, room, room_anchor(i, level.config))
 
-    for path in level.matrix:
-        board = carve_path(board, level, path)
+        level.room_ids = room_grid(level)
+        for i, path in enumerate(level.matrix):
+            corridor = len(level.rooms) + i
+            board = carve_path(board, level, path, rng, corridor)
 
-    return clean_board(board)
+    with timed(level.stats, "clean_board"):
+        return clean_board(board)
 
 
 def pick_final_rooms(level: Level) -> List[int]:
+    m_size, max_size = level.config.m_size, level.config.max_room_size
     rooms = []
     for i, room in enumerate(level.rooms):
         n = count_neighbours(level.matrix, i)
@@ -292,24 +507,24 @@ def pick_final_rooms(level: Level) -> List[int]:
         if n > 1:
             continue
 
-        x, y = index_to_pos(i, M_SIZE)
+        x, y = index_to_pos(i, m_size)
         w, h = room[0]
 
-        if x < M_SIZE - 1 and w >= MAX_ROOM_SIZE:
+        if x < m_size - 1 and w >= max_size:
             continue
 
-        if y < M_SIZE - 1 and h >= MAX_ROOM_SIZE:
+        if y < m_size - 1 and h >= max_size:
             continue
 
-        left = pos_to_index(x - 1, y, M_SIZE)
-        top = pos_to_index(x, y - 1, M_SIZE)
+        left = pos_to_index(x - 1, y, m_size)
+        top = pos_to_index(x, y - 1, m_size)
         left_size = level.rooms[left][0] if x > 0 else None
         top_size = level.rooms[top][0] if y > 0 else None
 
-        if left_size and left_size[0] >= MAX_ROOM_SIZE:
+        if left_size and left_size[0] >= max_size:
             continue
 
-        if top_size and top_size[1] >= MAX_ROOM_SIZE:
+        if top_size and top_size[1] >= max_size:
             continue
 
         if w > 5 and h > 5:
@@ -321,16 +536,13 @@ def pick_final_rooms(level: Level) -> List[int]:
 def pick_starting_room(level: Level) -> int:
     start = level.final_rooms[0]
     neighs = neighbours_map(level.matrix)
-    paths = find_paths(range(len(level.rooms)), start, neighs.get)
-
-    def distance(idx):
-        return len(extract_path(paths, idx))
+    paths = search(range(len(level.rooms)), start, neighs.get)
 
     far, d = start, 0
     for i in range(len(level.rooms)):
         if i in level.final_rooms or level.rooms[i][0] == (1, 1):
             continue
-        di = distance(i)
+        di = paths.distance(i) or 0
         if di > d:
             far = i
             d = di
@@ -346,14 +558,28 @@ def dig_door(val):
     return val + 20
 
 
-def amend_door(board: Board, room_index: int, door_fn) -> Board:
-    nodes = list(range(len(board)))
-    start = board.to_index(*room_anchor(room_index))
-    target = board.entrance
-    neighs = partial(board_neighbours, board, lambda x: not is_wall(x))
-    path = extract_path(find_paths(nodes, start, neighs), target)
+def is_not_wall(val: int) -> bool:
+    return not is_wall(val)
+
+
+# through anything but walls, amending doors doesn't change them
+def entrance_paths(board: Board) -> PathTree:
+    return board_graph(board, is_not_wall).search(board.entrance)
 
-    for i in path:
+
+# door_fn is applied to the first door from the room to the entrance
+def amend_door(
+    board: Board,
+    room_index: int,
+    door_fn,
+    paths: Optional[PathTree] = None,
+    config: GenConfig = DEFAULT_CONFIG,
+) -> Board:
+    if paths is None:
+        paths = entrance_paths(board)
+    start = board.to_index(*room_anchor(room_index, config))
+
+    for i in paths.path_from(start):
         if is_door(board[i]):
             board[i] = door_fn(board[i])
 
@@ -370,80 +596,118 @@ def amend_door(board: Board, room_index: int, door_fn) -> Board:
     return board
 
 
-def generate_level() -> Level:
+def generate_level(
+    config: GenConfig = DEFAULT_CONFIG, seed: Seed = None
+) -> Level:
+    rng = make_rng(seed)
+    stats: Dict[str, float] = {"attempts": 0}
     final_rooms: List[int] = []
+    # placed first when constructive, found in the level otherwise
+    placed: List[int] = []
 
+    # matrices without 3 suitable final rooms are rejected
     while len(final_rooms) < 3:
-        matrix = create_matrix()
-        level = Level(
-            matrix=matrix,
-            rooms=[random_room(matrix, i) for i in range(M_SIZE * M_SIZE)],
-        )
-        final_rooms = pick_final_rooms(level)[:3]
+        stats["attempts"] += 1
+        with timed(stats, "matrix"):
+            if config.constructive:
+                placed = place_final_rooms(rng, config)
+            matrix = create_matrix(rng, config, placed)
+        with timed(stats, "rooms"):
+            level = Level(
+                matrix=matrix,
+                rooms=[
+                    random_room(matrix, i, rng, config, placed)
+                    for i in range(config.n_rooms)
+                ],
+                config=config,
+                stats=stats,
+            )
+            final_rooms = placed or pick_final_rooms(level)[:3]
 
     level.final_rooms = final_rooms
-    level.start_room = pick_starting_room(level)
-    board = create_board(level)
+    with timed(stats, "rooms"):
+        level.start_room = pick_starting_room(level)
+    board = create_board(level, rng)
 
     (w, h), _ = level.rooms[level.start_room]
-    x, y = room_anchor(level.start_room)
+    x, y = room_anchor(level.start_room, config)
     board.entrance = board.to_index(x + int(w / 2), y + int(h / 2))
 
     level.board = board
     return level
 
 
-def populate_enemies(level: Level, stock, empty):
-    board = level.board
-    enemies = []
-    for i in range(len(board)):
-        if not is_empty(board[i]):
-            continue
-
-        if any(index_in_room(level, r, i) for r in level.final_rooms):
-            continue
+# 1 for the tiles an enemy can spawn on: empty and not active
+SPAWNABLE = bytes(
+    TILE_FLAGS[val] & (T_EMPTY | T_ACTIVE) == T_EMPTY for val in range(256)
+)
 
-        if any(board.to_index(*k.square) == i for k in level.items):
-            continue
 
-        if is_active_tile(board[i]):
-            continue
+# 1 for the cells where an enemy may spawn
+def spawn_mask(level: Level) -> bytearray:
+    board = level.grid
+    side = board.side
+    mask = board.cells.translate(SPAWNABLE)
+    for room in level.final_rooms:
+        rx, ry, w, h = level.room_bounds(room)
+        for y in range(ry, ry + h):
+            mask[y * side + rx : y * side + rx + w] = bytes(w)
+    for item in level.items:
+        mask[board.to_index(*item.square)] = 0
+    return mask
+
+
+def populate_enemies(level: Level, stock, empty, rng: random.Random):
+    """An enemy on each spawnable cell, at a (101 - empty) in 101 chance"""
+    board = level.grid
+    mask = spawn_mask(level)
+    p = (101 - empty) / 101
+    if p >= 1:
+        spawns = list(compress(range(len(board)), mask))
+    elif p <= 0:
+        spawns = []
+    else:
+        # geometric gaps over all the cells, the ones not spawnable are
+        # dropped: each spawnable cell keeps the same chance
+        spawns = []
+        scale = 1 / log(1 - p)
+        i = -1
+        while True:
+            # cells skipped before the next spawn: floor(log(U) / log(1-p))
+            i += 1 + int(log(1.0 - rng.random()) * scale)
+            if i >= len(mask):
+                break
+            if mask[i]:
+                spawns.append(i)
 
-        r = random.randint(0, 100)
-        if r >= empty:
-            enemy_cls = random.choice(stock)
-            e = enemy_cls(index_to_pos(i, board.side))
-            e.sprite.play()
-            enemies.append(e)
+    enemies = []
+    for i in spawns:
+        enemy_cls = rng.choice(stock)
+        e = enemy_cls(index_to_pos(i, board.side))
+        e.sprite.play()
+        enemies.append(e)
 
     return enemies
 
 
-def square_from_room(level: Level, room_index):
-    x = random.randrange(1, level.rooms[room_index][0][0] - 2)
-    y = random.randrange(1, level.rooms[room_index][0][1] - 2)
-    ox, oy = room_anchor(room_index)
+def square_from_room(level: Level, room_index, rng: random.Random):
+    ox, oy, w, h = level.room_bounds(room_index)
+    x = rng.randrange(1, w - 2)
+    y = rng.randrange(1, h - 2)
     return ox + x, oy + y
 
 
 def set_exit(level):
     final_rooms = level.final_rooms
     (w, h), _ = level.rooms[final_rooms[0]]
-    x, y = room_anchor(final_rooms[0])
+    x, y = room_anchor(final_rooms[0], level.config)
     level.board.set(x + int(w / 2), y + int(h / 2), 99)
 
     return level
 
 
-def index_in_room(level, room, index):
-    rx, ry = room_anchor(room)
-    (w, h), _ = level.rooms[room]
-    x, y = level.board.to_pos(index)
-    return x >= rx and x < rx + w and y >= ry and y < ry + h
-
-
-def place_minor_chest(level, effects=[ADD_KEY, ADD_KEY]):
-    rooms = random.choices(
+def place_minor_chest(level, rng: random.Random, effects=[ADD_KEY, ADD_KEY]):
+    rooms = rng.choices(
         [
             i
             for i in range(len(level.rooms))
@@ -455,77 +719,251 @@ def place_minor_chest(level, effects=[ADD_KEY, ADD_KEY]):
     )
     for i, effect in enumerate(effects):
         level.items.append(
-            Chest(effect, square=square_from_room(level, rooms[i]))
+            Chest(effect, square=square_from_room(level, rooms[i], rng))
         )
     return level
 
 
-def level_1() -> Level:
-    level = generate_level()
-    board = amend_door(level.board, level.final_rooms[0], dig_door)
-    for r in level.final_rooms[1:]:
-        board = amend_door(board, r, lock_door)
+def level_1(config: GenConfig = DEFAULT_CONFIG, seed: Seed = None) -> Level:
+    rng = make_rng(seed)
+    level = generate_level(config, rng)
+    with timed(level.stats, "amend_door"):
+        paths = entrance_paths(level.grid)
+        board = amend_door(
+            level.grid, level.final_rooms[0], dig_door, paths, config
+        )
+        for r in level.final_rooms[1:]:
+            board = amend_door(board, r, lock_door, paths, config)
 
-    level = place_minor_chest(level)
+    with timed(level.stats, "population"):
+        level = place_minor_chest(level, rng)
 
-    final_rooms = level.final_rooms
-    level.items.append(
-        Chest(MAGIC_WAND, square=square_from_room(level, final_rooms[1]))
-    )
-    level.items.append(
-        Chest(TELEPORT_SPELL, square=square_from_room(level, final_rooms[2]))
-    )
+        final_rooms = level.final_rooms
+        level.items.append(
+            Chest(
+                MAGIC_WAND, square=square_from_room(level, final_rooms[1], rng)
+            )
+        )
+        level.items.append(
+            Chest(
+                TELEPORT_SPELL,
+                square=square_from_room(level, final_rooms[2], rng),
+            )
+        )
 
-    stock = [Bat] * 2 + [Slug]
-    level.enemies = populate_enemies(level, stock, empty=95)
+        stock = [Bat] * 2 + [Slug]
+        level.enemies = populate_enemies(level, stock, empty=95, rng=rng)
 
-    level = set_exit(level)
+        level = set_exit(level)
     return level
 
 
-def level_2() -> Level:
-    level = generate_level()
+def level_2(config: GenConfig = DEFAULT_CONFIG, seed: Seed = None) -> Level:
+    rng = make_rng(seed)
+    level = generate_level(config, rng)
 
-    level = place_minor_chest(level)
+    with timed(level.stats, "population"):
+        level = place_minor_chest(level, rng)
 
-    final_rooms = level.final_rooms
-    level.items.append(
-        Chest(TRI_A, square=square_from_room(level, final_rooms[1]))
-    )
-    level.items.append(
-        Chest(ARMOR, square=square_from_room(level, final_rooms[2]))
-    )
+        final_rooms = level.final_rooms
+        level.items.append(
+            Chest(TRI_A, square=square_from_room(level, final_rooms[1], rng))
+        )
+        level.items.append(
+            Chest(ARMOR, square=square_from_room(level, final_rooms[2], rng))
+        )
 
-    level.board[level.board.entrance] = 66
-    set_exit(level)
+        level.board[level.board.entrance] = 66
+        set_exit(level)
 
-    stock = [Skeleton] * 3 + [Bat] * 3 + [Plant] + [Slug] * 4
-    level.enemies = populate_enemies(level, stock, empty=97)
+        stock = [Skeleton] * 3 + [Bat] * 3 + [Plant] + [Slug] * 4
+        level.enemies = populate_enemies(level, stock, empty=97, rng=rng)
 
     return level
 
 
-def level_3() -> Level:
-    level = generate_level()
+def level_3(config: GenConfig = DEFAULT_CONFIG, seed: Seed = None) -> Level:
+    rng = make_rng(seed)
+    level = generate_level(config, rng)
 
-    level = place_minor_chest(level, [ADD_KEY, ADD_KEY, VIAL])
+    with timed(level.stats, "population"):
+        level = place_minor_chest(level, rng, [ADD_KEY, ADD_KEY, VIAL])
 
-    final_rooms = level.final_rooms
-    level.items.append(
-        Chest(TRI_B, square=square_from_room(level, final_rooms[1]))
+        final_rooms = level.final_rooms
+        level.items.append(
+            Chest(TRI_B, square=square_from_room(level, final_rooms[1], rng))
+        )
+        level.items.append(
+            Chest(
+                THUNDER, square=square_from_room(level, final_rooms[2], rng)
+            )
+        )
+
+        level.board[level.board.entrance] = 66
+        boss_room = level.final_rooms[0]
+        (w, h), _ = level.rooms[boss_room]
+        x, y = room_anchor(boss_room, config)
+        boss = Necromancer((int(x + w / 2), int(y + h / 2)), boss_room)
+
+        stock = [Skeleton] * 3 + [Bat] * 3 + [Plant] + [Slug] * 4
+        level.enemies = populate_enemies(level, stock, empty=96, rng=rng)
+        level.enemies.append(boss)
+
+    return level
+
+
+# Caves are grown on bitboards: one bit per cell (cell `i` is bit `i`),
+# set for walls. Neighbours are the board shifted by one cell or one row.
+CAVE_SMOOTHING = 4
+_BIT_MASKS: dict = {}
+
+
+# bits of the first/last column and row
+def _bit_masks(side):
+    if side not in _BIT_MASKS:
+        first_col = sum(1 << (y * side) for y in range(side))
+        first_row = (1 << side) - 1
+        _BIT_MASKS[side] = (
+            first_col,
+            first_col << (side - 1),
+            first_row,
+            first_row << (side * (side - 1)),
+        )
+    return _BIT_MASKS[side]
+
+
+# the 8 neighbour boards, outside of the board is wall
+def _wall_neighbours(walls: int, side: int) -> List[int]:
+    first_col, last_col, first_row, last_row = _bit_masks(side)
+    full = (1 << side * side) - 1
+    west = (walls << 1) & full & ~first_col | first_col
+    east = (walls >> 1) & ~last_col | last_col
+    boards = []
+    for b in (west, walls, east):
+        boards.append((b << side) & full | first_row)  # north
+        boards.append((b >> side) | last_row)  # south
+    return boards + [west, east]
+
+
+# 5 walls or more in the 3x3 block make a wall, the neighbour counts
+# are summed for all the cells at once, one bit per integer
+def smooth_cave(walls: int, side: int) -> int:
+    c0 = c1 = c2 = c3 = 0
+    for b in _wall_neighbours(walls, side) + [walls]:
+        carry = c0 & b
+        c0 ^= b
+        carry, c1 = c1 & carry, c1 ^ carry
+        carry, c2 = c2 & carry, c2 ^ carry
+        c3 |= carry
+    return c3 | (c2 & (c1 | c0))
+
+
+# floors connected to start, and the last layer reached
+def flood_cave(floors: int, start: int, side: int) -> Tuple[int, int]:
+    first_col, last_col, _, _ = _bit_masks(side)
+    # a cell spreading east/west mustn't wrap to the next/previous row
+    to_east, to_west = floors & ~first_col, floors & ~last_col
+    region = layer = 1 << start
+    left = floors & ~region
+    while True:
+        grown = (
+            (layer << 1) & to_east
+            | (layer >> 1) & to_west
+            | layer << side
+            | layer >> side
+        ) & left
+        if not grown:
+            return region, layer
+        left ^= grown
+        region |= grown
+        layer = grown
+
+
+# the first set bit from a random position
+def _pick_bit(bits: int, rng: random.Random, n: int) -> int:
+    pos = rng.randrange(n)
+    after = bits >> pos
+    if after:
+        return pos + (after & -after).bit_length() - 1
+    return (bits & -bits).bit_length() - 1
+
+
+def _bits_to_cells(bits: int, n: int) -> bytearray:
+    return bytearray(
+        format(bits, f"0{n}b")[::-1].encode().translate(_BIT_TO_CELL)
     )
-    level.items.append(
-        Chest(THUNDER, square=square_from_room(level, final_rooms[2]))
+
+
+_BIT_TO_CELL = bytes.maketrans(b"01", b"\x00\x01")
+
+
+def generate_cave(
+    config: GenConfig = DEFAULT_CONFIG, seed: Seed = None
+) -> Level:
+    """Smoothed random walls, keeping the biggest open area"""
+    rng = make_rng(seed)
+    stats: Dict[str, float] = {"attempts": 1}
+    side = config.side
+    n = side * side
+    full = (1 << n) - 1
+
+    with timed(stats, "matrix"):
+        # about 44% of walls (7/16)
+        a, b, c, d = (rng.getrandbits(n) for _ in range(4))
+        walls = a & ~(b & c & d)
+        for _ in range(CAVE_SMOOTHING):
+            walls = smooth_cave(walls, side)
+
+        # keep the biggest area, the others are filled
+        floors = full & ~walls
+        unexplored = floors
+        region, far, entrance = 0, 0, 0
+        while bin(unexplored).count("1") > bin(region).count("1"):
+            start = _pick_bit(unexplored, rng, n)
+            area, layer = flood_cave(floors, start, side)
+            if bin(area).count("1") > bin(region).count("1"):
+                region, far, entrance = area, layer, start
+            unexplored &= ~area
+        walls = full & ~region
+
+    with timed(stats, "carving"):
+        board = Board(cells=_bits_to_cells(walls, n), side=side)
+    with timed(stats, "clean_board"):
+        board = clean_board(board)
+
+    board.entrance = entrance
+    board[entrance] = 66
+    board[_pick_bit(far, rng, n)] = 99
+    level = Level(
+        matrix=[], rooms=[], board=board, config=config, stats=stats
     )
+    level.room_ids = room_grid(level)
+    return level
+
 
-    level.board[level.board.entrance] = 66
-    boss_room = level.final_rooms[0]
-    (w, h), _ = level.rooms[boss_room]
-    x, y = room_anchor(boss_room)
-    boss = Necromancer((int(x + w / 2), int(y + h / 2)), boss_room)
+def cave_level(config: GenConfig = DEFAULT_CONFIG, seed: Seed = None) -> Level:
+    rng = make_rng(seed)
+    level = generate_cave(config, rng)
 
-    stock = [Skeleton] * 3 + [Bat] * 3 + [Plant] + [Slug] * 4
-    level.enemies = populate_enemies(level, stock, empty=96)
-    level.enemies.append(boss)
+    with timed(level.stats, "population"):
+        # any spawnable cell, drawn by rejection: most of a cave is floor
+        mask = spawn_mask(level)
+        if 1 not in mask:
+            raise ValueError("no floor left for the chest")
+        chest = rng.randrange(len(mask))
+        while not mask[chest]:
+            chest = rng.randrange(len(mask))
+        level.items.append(Chest(VIAL, square=level.grid.to_pos(chest)))
+
+        stock = [Bat] * 3 + [Slug] * 3 + [Plant] + [Skeleton]
+        level.enemies = populate_enemies(level, stock, empty=97, rng=rng)
 
     return level
+
+
+FLOOR_TYPES = {
+    "level_1": level_1,
+    "level_2": level_2,
+    "level_3": level_3,
+    "cave": cave_level,
+}
@@ -6,6 +6,7 @@ from functools import partial
 from rogue.constants import FPS, CELL_SIZE, TPV, DType
 from rogue.core import is_empty, dist, LEFT, RIGHT, ANIMATED
 from rogue.core import AIActor, ActionReport, State, Board, AnimSprite
+from rogue.graph import board_graph, cluster_paths
 from rogue.particles import Projectile, DamageText, BossMolecule
 from rogue.items import Book
 
@@ -18,27 +19,70 @@ def can_walk(board: Board, x, y) -> bool:
     return not board.outside(x, y) and is_empty(board.get(x, y))
 
 
+# steps to the player, shared by the chasers until it moves or the
+# board changes
+def chase_map(state: State):
+    key = state.current_level, state.player.square, state.board.revision
+    if state.chase_key != key:
+        board = state.board
+        state.chase_key = key
+        state.chase_map = board_graph(board, is_empty).distances(
+            board.to_index(*state.player.square),
+            max_dist=state.active_range,
+        )
+    return state.chase_map
+
+
+# past the chase map, planned on the room matrix slots
+def long_chase_step(state: State, e: AIActor):
+    board = state.board
+    planner = cluster_paths(
+        board, is_empty, state.level.config.max_room_size
+    )
+    path = planner.find_path(
+        board.to_index(*e.square), board.to_index(*state.player.square)
+    )
+    return board.to_pos(path[0]) if path else None
+
+
 def straight_line(state: State, e: AIActor, end_turn) -> ActionReport:
     possible = [
         n
         for n in state.board.neighbours(*e.pos)
-        if can_walk(state.board, *n) and n not in state.occupied
+        if can_walk(state.board, *n) and not state.level.actor_at(*n)
     ]
-    if e.square in state.visible and possible:
-        possible = sorted(possible, key=lambda x: dist(x, state.player.square))
-        if possible[0] == state.player.square:
-            return e.attack(state.player, end_turn)
+    seen = e.square in state.visible
+    speed = int(0.3 * FPS) if seen else 1
+    # with State.hunt, chasers keep after the player once they saw it
+    e.hunting = seen or (state.hunt and e.hunting)
+    best = None
+    if e.hunting and possible:
+        steps = chase_map(state)
+
+        def _cost(n):
+            d = steps.get(state.board.to_index(*n), float("inf"))
+            return d, dist(n, state.player.square)
+
+        if seen or state.board.to_index(*e.square) in steps:
+            best = min(possible, key=_cost)
         else:
-            x, y = possible[0]
-            e.move(x, y, end_turn)
-            return x, y
+            best = long_chase_step(state, e)
+            e.hunting = best is not None
+            if best not in possible:
+                best = None
+
+    if best == state.player.square:
+        return e.attack(state.player, end_turn)
+    elif best is not None:
+        x, y = best
+        e.move(x, y, end_turn, speed)
+        return x, y
+    elif possible:
+        x, y = random.choice(possible)
+        e.move(x, y, end_turn, 1)
+        return x, y
     else:
-        if possible:
-            x, y = random.choice(possible)
-            e.move(x, y, end_turn, 1)
-            return x, y
-        else:
-            e.wait(10, end_turn)
+        e.wait(10, end_turn)
     return None
 
 
@@ -46,7 +90,7 @@ def random_move(state: State, e: AIActor, end_turn) -> ActionReport:
     possible = [
         n
         for n in state.board.neighbours(*e.pos)
-        if can_walk(state.board, *n) and n not in state.occupied
+        if can_walk(state.board, *n) and not state.level.actor_at(*n)
     ]
 
     speed = int(0.3 * FPS) if e.square in state.visible else 1
@@ -141,33 +185,27 @@ class Necromancer(Shooter):
         self._invoke_sprite = AnimSprite(*ANIMATED[9888])
         self.room = room
 
-    def pick_free_spot(self, state):
-        from rogue.dungeon_gen import room_anchor
-
-        (w, h), _ = state.level.rooms[self.room]
-        ax, ay = room_anchor(self.room)
-        x, y = self.pos
-
-        def _occupied(x, y):
-            return bool(state.get_entity(x, y))
-
-        cpt = 0
-        while _occupied(x, y):
-            x = ax + random.randrange(0, w)
-            y = ay + random.randrange(0, h)
-            cpt += 1
-            if cpt > 10:
-                print("oups, occupied")
-
-        return x, y
+    # None when the room is full
+    def pick_free_spot(self, state, away=1):
+        player = state.player.square
+        spots = [
+            square
+            for square in state.level.free_cells(self.room)
+            if dist(square, player) >= away
+        ]
+        if not spots:
+            return None
+        return random.choice(spots)
 
     def spawn_skel(self, state):
         pos = self.pick_free_spot(state)
-        return Skeleton(pos, self)
+        return None if pos is None else Skeleton(pos, self)
 
     def _do_spawn(self, state, caller, *, end):
         for _ in range(3):
-            state.enemies.append(self.spawn_skel(state))
+            skel = self.spawn_skel(state)
+            if skel is not None:
+                state.level.add_enemy(skel)
         self.sprite = self._base_sprite
         self.sprite.play()
         end(caller)
@@ -191,17 +229,17 @@ class Necromancer(Shooter):
 
         self.cooldown_shoot -= 1
 
-        if self.should_tp:
-            pos = state.player.pos
-            while dist(pos, state.player.pos) < 4:
-                pos = self.pick_free_spot(state)
+        pos = self.pick_free_spot(state, 4) if self.should_tp else None
+        # no room to teleport to, it fights where it is
+        self.should_tp = False
+        if pos is not None:
             for _ in range(50):
                 state.particles.append(
                     BossMolecule(_center(self.pos), _center(pos), TPV)
                 )
             self.sprite = self._teleport_sprite
-            self.should_tp = False
-            return self.move(*pos, end_turn_fn, TPV)
+            self.move(*pos, end_turn_fn, TPV)
+            return pos
 
         elif can_invoke:
             self.cooldown_spawn = 4
@@ -234,10 +272,12 @@ class Necromancer(Shooter):
         if self.pv < 1:
             pyxel.stop()
             pyxel.playm(2, loop=True)
-            for e in self.state_ref.enemies:
-                if e.parent == self:
-                    e.hurt(10)
-            self.state_ref.level.items.append(Book(square=self.square))
+            # the skeletons die with it, even those out of the active range
+            level = self.state_ref.level
+            for e in [e for e in level.enemies if e.parent == self]:
+                e.hurt(10)
+                level.remove_enemy(e)
+            self.state_ref.level.add_item(Book(square=self.square))
 
 class Plant(Shooter):
     zindex = 1
@@ -1,4 +1,7 @@
-from collections import defaultdict
+from __future__ import annotations
+from array import array
+from collections import defaultdict, deque
+from heapq import heappop, heappush
 
 
 def neighbours_map(matrix):
@@ -20,39 +23,349 @@ def board_neighbours(board, can_walk_fn, i):
     ]
 
 
-def find_paths(nodes, start, neighbours_fn):
-    q = set(nodes)
-    prev = dict()
-    dist = defaultdict(lambda: float("inf"))
-    dist[start] = 0
+class BoardGraph:
+    """
+    Walkable neighbours of each index, in compressed sparse row form.
+    `can_walk_fn` must only depend on the tile value.
+    """
 
-    def min_dist():
-        n, d = None, float("inf")
-        for k in q:
-            v = dist[k]
-            if v < d:
-                n, d = k, v
-        return n
+    def __init__(self, board, can_walk_fn):
+        side, n = board.side, len(board)
+        table = bytes(bool(can_walk_fn(val)) for val in range(256))
+        walk = bytes(board.cells).translate(table)
 
-    while q:
-        u = min_dist()
-        if dist[u] == float("inf"):
-            break  # no more accessible nodes
-        q.discard(u)
+        offsets = array("l", [0])
+        targets = array("l")
+        for i in range(n):
+            x = i % side
+            if i >= side and walk[i - side]:
+                targets.append(i - side)
+            if x < side - 1 and walk[i + 1]:
+                targets.append(i + 1)
+            if i + side < n and walk[i + side]:
+                targets.append(i + side)
+            if x > 0 and walk[i - 1]:
+                targets.append(i - 1)
+            offsets.append(len(targets))
 
-        for v in neighbours_fn(u):
-            tmp = dist[u] + 1
-            if tmp < dist[v]:
-                dist[v] = tmp
+        self.offsets = offsets
+        self.targets = targets
+        self.revision = board.revision
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def neighbours(self, i):
+        return self.targets[self.offsets[i] : self.offsets[i + 1]]
+
+    def search(self, start, target=None) -> PathTree:
+        offsets, targets = self.offsets, self.targets
+        prev = dict()
+        dist = {start: 0}
+        q = deque([start])
+        while q:
+            u = q.popleft()
+            d = dist[u] + 1
+            for k in range(offsets[u], offsets[u + 1]):
+                v = targets[k]
+                if v in dist:
+                    continue
+                dist[v] = d
                 prev[v] = u
+                if v == target:
+                    return PathTree(start, prev, dist)
+                q.append(v)
+
+        return PathTree(start, prev, dist)
 
-    return prev
+    def distances(self, start, max_dist=None):
+        offsets, targets = self.offsets, self.targets
+        dist = {start: 0}
+        q = deque([start])
+        while q:
+            u = q.popleft()
+            d = dist[u] + 1
+            if max_dist is not None and d > max_dist:
+                continue
+            for k in range(offsets[u], offsets[u + 1]):
+                v = targets[k]
+                if v not in dist:
+                    dist[v] = d
+                    q.append(v)
+
+        return dist
+
+
+# compiled once, kept on the board until it changes
+def board_graph(board, can_walk_fn) -> BoardGraph:
+    graph = board.derived.get(can_walk_fn)
+    if graph is None or graph.revision != board.revision:
+        graph = board.derived[can_walk_fn] = BoardGraph(board, can_walk_fn)
+    return graph
+
+
+def find_paths(nodes, start, neighbours_fn, target=None):
+    return search(nodes, start, neighbours_fn, target).prev
+
+
+# breadth first find_paths, with the distances
+def search(nodes, start, neighbours_fn, target=None) -> PathTree:
+    if not isinstance(nodes, (set, frozenset, range, dict)):
+        nodes = set(nodes)
+
+    prev = dict()
+    dist = {start: 0}
+    q = deque([start])
+    while q:
+        u = q.popleft()
+        if u not in nodes:
+            continue
+        d = dist[u] + 1
+        for v in neighbours_fn(u):
+            if v in dist:
+                continue
+            dist[v] = d
+            prev[v] = u
+            if v == target:
+                return PathTree(start, prev, dist)
+            q.append(v)
+
+    return PathTree(start, prev, dist)
 
 
 def extract_path(paths, target):
     path = []
     u = target
     while u in paths:
-        path.insert(0, u)
+        path.append(u)
         u = paths[u]
+    path.reverse()
     return path
+
+
+# one search for the path and distance queries of many targets
+class PathTree:
+    def __init__(self, source, prev, dist):
+        self.source = source
+        self.prev = prev
+        self.dist = dist
+
+    def reached(self, node) -> bool:
+        return node in self.dist
+
+    def distance(self, node):
+        return self.dist.get(node)
+
+    # excludes the source
+    def path_to(self, node):
+        return extract_path(self.prev, node)
+
+    # back to the source, node excluded
+    def path_from(self, node):
+        u = node
+        while u in self.prev:
+            u = self.prev[u]
+            yield u
+
+
+class ClusterPaths:
+    """
+    Paths planned from portal to portal between square clusters of `size`,
+    then within the clusters. Only changed clusters are rebuilt.
+    """
+
+    def __init__(self, board, can_walk_fn, size):
+        self.board = board
+        self.size = size
+        self.per_side = -(-board.side // size)
+        self._table = bytes(bool(can_walk_fn(val)) for val in range(256))
+        self.revision = None
+        self.refresh()
+
+    def cluster(self, i):
+        x, y = self.board.to_pos(i)
+        return (y // self.size) * self.per_side + x // self.size
+
+    def _cluster_neighbours(self, c):
+        n = self.per_side
+        cx, cy = c % n, c // n
+        around = [(cx, cy - 1), (cx + 1, cy), (cx, cy + 1), (cx - 1, cy)]
+        return [y * n + x for x, y in around if 0 <= x < n and 0 <= y < n]
+
+    def refresh(self):
+        board = self.board
+        if self.revision == board.revision:
+            return
+
+        changes = None
+        if self.revision is not None:
+            changes = board.changes_since(self.revision)
+        self.revision = board.revision
+        self.walk = bytes(board.cells).translate(self._table)
+
+        if changes is None:
+            self.crossings = {}
+            self.portals = {}
+            self.trees = {}
+            dirty = set(range(self.per_side * self.per_side))
+        else:
+            dirty = {self.cluster(i) for i in changes}
+
+        for c in dirty:
+            for n in self._cluster_neighbours(c):
+                self._find_crossings(min(c, n), max(c, n))
+
+        affected = set(dirty)
+        for c in dirty:
+            affected.update(self._cluster_neighbours(c))
+        for c in affected:
+            for p in self.portals.pop(c, ()):
+                self.trees.pop(p, None)
+            self.portals[c] = set()
+        for (c1, c2), pairs in self.crossings.items():
+            for a, b in pairs:
+                if c1 in affected:
+                    self.portals[c1].add(a)
+                if c2 in affected:
+                    self.portals[c2].add(b)
+
+    # portal pairs, c1 < c2
+    def _find_crossings(self, c1, c2):
+        side, size, walk = self.board.side, self.size, self.walk
+        x1, y1 = (c1 % self.per_side) * size, (c1 // self.per_side) * size
+
+        if c2 == c1 + 1:  # c2 on the right
+            x = x1 + size - 1
+            border = [
+                (y * side + x, y * side + x + 1)
+                for y in range(y1, min(y1 + size, side))
+            ]
+        else:  # c2 below
+            y = y1 + size - 1
+            border = [
+                (y * side + x, (y + 1) * side + x)
+                for x in range(x1, min(x1 + size, side))
+            ]
+
+        pairs, run = [], []
+        for a, b in border + [(None, None)]:
+            if a is not None and walk[a] and walk[b]:
+                run.append((a, b))
+            elif run:
+                pairs.append(run[len(run) // 2])
+                run = []
+        self.crossings[c1, c2] = pairs
+
+    # without leaving the cluster
+    def _local_search(self, start) -> PathTree:
+        side, size, walk = self.board.side, self.size, self.walk
+        x, y = self.board.to_pos(start)
+        left, top = x - x % size, y - y % size
+        right, bottom = min(left + size, side), min(top + size, side)
+
+        prev, dist = dict(), {start: 0}
+        q = deque([start])
+        while q:
+            u = q.popleft()
+            d = dist[u] + 1
+            x, y = u % side, u // side
+            for v, inside in [
+                (u - side, y > top),
+                (u + 1, x < right - 1),
+                (u + side, y < bottom - 1),
+                (u - 1, x > left),
+            ]:
+                if inside and walk[v] and v not in dist:
+                    dist[v] = d
+                    prev[v] = u
+                    q.append(v)
+        return PathTree(start, prev, dist)
+
+    def _tree(self, portal) -> PathTree:
+        tree = self.trees.get(portal)
+        if tree is None:
+            tree = self.trees[portal] = self._local_search(portal)
+        return tree
+
+    def _links(self, portal):
+        c = self.cluster(portal)
+        for n in self._cluster_neighbours(c):
+            for a, b in self.crossings.get((min(c, n), max(c, n)), ()):
+                if a == portal:
+                    yield b
+                elif b == portal:
+                    yield a
+
+    def find_path(self, start, goal):
+        """Path without `start`, None if `goal` can't be reached"""
+        self.refresh()
+        from_start = self._local_search(start)
+        if from_start.reached(goal):
+            return from_start.path_to(goal)
+        if not self.walk[goal]:
+            return None
+
+        to_goal = self._local_search(goal)
+        exits = {
+            q: to_goal.distance(q)
+            for q in self.portals[self.cluster(goal)]
+            if to_goal.reached(q)
+        }
+
+        goal_node = -1
+        dist, prev = {}, {}
+        q = []
+        for p in self.portals[self.cluster(start)]:
+            if from_start.reached(p):
+                dist[p] = from_start.distance(p)
+                prev[p] = None
+                heappush(q, (dist[p], p))
+
+        while q:
+            d, u = heappop(q)
+            if d > dist.get(u, float("inf")):
+                continue
+            if u == goal_node:
+                break
+
+            steps = []
+            if u in exits:
+                steps.append((goal_node, exits[u]))
+            tree = self._tree(u)
+            for p in self.portals[self.cluster(u)]:
+                if p != u and tree.reached(p):
+                    steps.append((p, tree.distance(p)))
+            steps.extend((v, 1) for v in self._links(u))
+
+            for v, cost in steps:
+                if d + cost < dist.get(v, float("inf")):
+                    dist[v] = d + cost
+                    prev[v] = u
+                    heappush(q, (d + cost, v))
+
+        if goal_node not in prev:
+            return None
+
+        portals = []
+        u = prev[goal_node]
+        while u is not None:
+            portals.append(u)
+            u = prev[u]
+        portals.reverse()
+
+        path = from_start.path_to(portals[0])
+        for a, b in zip(portals, portals[1:]):
+            if self.cluster(a) == self.cluster(b):
+                path.extend(self._tree(a).path_to(b))
+            else:
+                path.append(b)
+        path.extend(to_goal.path_from(portals[-1]))
+        return path
+
+
+def cluster_paths(board, can_walk_fn, size) -> ClusterPaths:
+    key = ClusterPaths, can_walk_fn, size
+    paths = board.derived.get(key)
+    if paths is None:
+        paths = board.derived[key] = ClusterPaths(board, can_walk_fn, size)
+    return paths
@@ -67,7 +67,7 @@ class Chest(LevelItem):
     def interact(self, state: State):
         state = self.content_fn(state)
         # I know...
-        state.level.items.remove(self)
+        state.level.remove_item(self)
 
 
 class Book(LevelItem):
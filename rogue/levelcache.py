@@ -0,0 +1,117 @@
+# floors packed on disk by type, config and seed, under a hash of the
+# generator sources, the least recently used go beyond max_bytes
+
+import hashlib
+import mmap
+import os
+import struct
+from typing import List, Optional, Tuple
+
+from rogue import core, dungeon_gen, enemies, graph, items, levelpack
+from rogue.core import GenConfig, Level
+from rogue.levelpack import build_floor, unpack_level
+
+
+def _generator_version() -> str:
+    digest = hashlib.sha1()
+    for module in (core, graph, dungeon_gen, enemies, items, levelpack):
+        assert module.__file__ is not None
+        with open(module.__file__, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:12]
+
+
+GENERATOR_VERSION = _generator_version()
+SUFFIX = ".lvl"
+EVICT_EVERY = 64
+
+
+class LevelCache:
+    def __init__(self, path: str, max_bytes: int = 64 << 20):
+        self.path = path
+        self.max_bytes = max_bytes
+        # bytes in the cache as of the last eviction plus the writes since
+        self._size: Optional[int] = None
+        self._stores = 0
+        os.makedirs(path, exist_ok=True)
+
+    def entry(self, kind: str, config: GenConfig, seed: int) -> str:
+        name = f"{GENERATOR_VERSION}-{kind}-{config.key}-{seed}{SUFFIX}"
+        return os.path.join(self.path, name)
+
+    def read(self, kind: str, config: GenConfig, seed: int) -> Optional[bytes]:
+        return self._open(kind, config, seed, bytes)
+
+    # unpacked straight from the mapped file
+    def load(self, kind: str, config: GenConfig, seed: int) -> Optional[Level]:
+        return self._open(kind, config, seed, unpack_level)
+
+    def _open(self, kind, config, seed, decode):
+        path = self.entry(kind, config, seed)
+        try:
+            with open(path, "rb") as f, mmap.mmap(
+                f.fileno(), 0, access=mmap.ACCESS_READ
+            ) as data:
+                result = decode(data)
+        except (OSError, ValueError, struct.error):
+            # missing, or not a (complete) pack
+            return None
+        # modification time tracks the last use, for the eviction
+        os.utime(path)
+        return result
+
+    def store(self, kind: str, config: GenConfig, seed: int, data: bytes):
+        path = self.entry(kind, config, seed)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        self._stores += 1
+        if self._size is not None:
+            self._size += len(data)
+        # scan once the writes may have passed the bound, and every
+        # EVICT_EVERY writes for those of other processes
+        if (
+            self._size is None
+            or self._size > self.max_bytes
+            or self._stores % EVICT_EVERY == 0
+        ):
+            self.evict()
+
+    def fetch(self, kind: str, config: GenConfig, seed: int) -> bytes:
+        data = self.read(kind, config, seed)
+        if data is None:
+            data = build_floor(kind, config, seed)
+            self.store(kind, config, seed, data)
+        return data
+
+    # (current version, last use, size, path) of each entry
+    def entries(self) -> List[Tuple[bool, float, int, str]]:
+        entries = []
+        for entry in os.scandir(self.path):
+            if not entry.name.endswith(SUFFIX):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            current = entry.name.startswith(GENERATOR_VERSION + "-")
+            entries.append((current, stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    # stale entries first, down to 7/8 of max_bytes when over it
+    def evict(self):
+        entries = sorted(self.entries())
+        total = sum(size for _, _, size, _ in entries)
+        limit = self.max_bytes
+        if total > limit:
+            limit -= limit // 8
+        for current, _, size, path in entries:
+            if current and total <= limit:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._size = total
@@ -0,0 +1,244 @@
+# levels packed as little endian bytes, for the workers and the cache:
+# header, matrix, rooms, final rooms, cells, corridors, items, enemies
+
+import struct
+import zlib
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from rogue.core import (
+    Board,
+    CellSet,
+    GenConfig,
+    Level,
+    LevelItem,
+    NO_ROOM,
+    State,
+)
+from rogue.dungeon_gen import FLOOR_TYPES, room_grid
+from rogue.enemies import Slug, Skeleton, Ghost, Plant, Bat, Necromancer
+from rogue.items import (
+    Book,
+    Chest,
+    ADD_KEY,
+    VIAL,
+    TELEPORT_SPELL,
+    MAGIC_WAND,
+    ARMOR,
+    THUNDER,
+    TRI_A,
+    TRI_B,
+)
+
+MAGIC = b"RWLV"
+VERSION = 5
+
+# magic, version, m_size, max_room_size, config flags, side, entrance,
+# start_room, then the number of matrix paths, rooms, final rooms,
+# corridor cells, items and enemies
+HEADER = struct.Struct("<4sBBBBHIHHHBIHH")
+PATH = struct.Struct("<HH")
+ROOM = struct.Struct("<BBBB")  # w, h, offset x, offset y
+FINAL_ROOM = struct.Struct("<H")
+CORRIDOR = struct.Struct("<IH")  # cell index, room id
+ITEM = struct.Struct("<BBHH")  # kind, chest content, x, y
+ENEMY = struct.Struct("<BBHHHb")  # kind, flags, x, y, room, pv
+
+# an entry's position in these lists is its code in the pack
+ITEM_KINDS = [Chest, Book]
+CHEST_CONTENTS = [
+    ADD_KEY,
+    VIAL,
+    TELEPORT_SPELL,
+    MAGIC_WAND,
+    ARMOR,
+    THUNDER,
+    TRI_A,
+    TRI_B,
+]
+ENEMY_KINDS = [Slug, Skeleton, Ghost, Plant, Bat, Necromancer]
+
+C_CONSTRUCTIVE = 1  # GenConfig.constructive
+E_PLAYING = 1  # enemy sprite is animated
+E_SUMMONED = 2  # skeleton summoned by the Necromancer of the level
+E_HUNTING = 4  # after the player (see State.hunt)
+
+
+def _code(table, value, what) -> int:
+    for i, entry in enumerate(table):
+        if entry is value:
+            return i
+    raise ValueError(f"cannot pack {what} {value!r}")
+
+
+# enemies are expected idle, only their square and pv are kept
+def pack_level(level: Level) -> bytes:
+    config, board = level.config, level.grid
+    corridors = [
+        (i, room)
+        for i, room in enumerate(level.room_ids)
+        if len(level.rooms) <= room != NO_ROOM
+    ]
+    out = [
+        HEADER.pack(
+            MAGIC,
+            VERSION,
+            config.m_size,
+            config.max_room_size,
+            C_CONSTRUCTIVE if config.constructive else 0,
+            board.side,
+            board.entrance,
+            level.start_room,
+            len(level.matrix),
+            len(level.rooms),
+            len(level.final_rooms),
+            len(corridors),
+            len(level.items),
+            len(level.enemies),
+        )
+    ]
+    out.extend(PATH.pack(a, b) for a, b in level.matrix)
+    out.extend(ROOM.pack(w, h, ox, oy) for (w, h), (ox, oy) in level.rooms)
+    out.extend(FINAL_ROOM.pack(r) for r in level.final_rooms)
+    out.append(bytes(board.cells))
+    out.extend(CORRIDOR.pack(i, room) for i, room in corridors)
+    for item in level.items:
+        kind = _code(ITEM_KINDS, type(item), "item")
+        content = 0
+        if isinstance(item, Chest):
+            content = _code(CHEST_CONTENTS, item.content_fn, "chest content")
+        out.append(ITEM.pack(kind, content, *item.square))
+    for e in level.enemies:
+        kind = _code(ENEMY_KINDS, type(e), "enemy")
+        flags = E_PLAYING if e.sprite.playing else 0
+        if e.parent is not None:
+            flags |= E_SUMMONED
+        if e.hunting:
+            flags |= E_HUNTING
+        room = getattr(e, "room", 0)
+        out.append(ENEMY.pack(kind, flags, *e.square, room, e.pv))
+    return b"".join(out)
+
+
+def unpack_level(data) -> Level:
+    data = memoryview(data)
+    (
+        magic,
+        version,
+        m_size,
+        max_room_size,
+        config_flags,
+        side,
+        entrance,
+        start_room,
+        n_paths,
+        n_rooms,
+        n_finals,
+        n_corridors,
+        n_items,
+        n_enemies,
+    ) = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"not a level pack (version {VERSION})")
+    offset = HEADER.size
+
+    def read(fmt: struct.Struct, n: int) -> List[tuple]:
+        nonlocal offset
+        entries = list(fmt.iter_unpack(data[offset : offset + fmt.size * n]))
+        offset += fmt.size * n
+        return entries
+
+    config = GenConfig(
+        m_size, max_room_size, bool(config_flags & C_CONSTRUCTIVE)
+    )
+    matrix = read(PATH, n_paths)
+    rooms = [((w, h), (ox, oy)) for w, h, ox, oy in read(ROOM, n_rooms)]
+    final_rooms = [r for r, in read(FINAL_ROOM, n_finals)]
+    cells = bytearray(data[offset : offset + side * side])
+    offset += side * side
+    corridors = read(CORRIDOR, n_corridors)
+
+    items: List[LevelItem] = []
+    for kind, content, x, y in read(ITEM, n_items):
+        if ITEM_KINDS[kind] is Chest:
+            items.append(Chest(CHEST_CONTENTS[content], square=(x, y)))
+        else:
+            items.append(ITEM_KINDS[kind](square=(x, y)))
+
+    enemies = []
+    summoned = []
+    for kind, flags, x, y, room, pv in read(ENEMY, n_enemies):
+        cls = ENEMY_KINDS[kind]
+        e = cls((x, y), room) if cls is Necromancer else cls((x, y))
+        e.pv = pv
+        if flags & E_PLAYING:
+            e.sprite.play()
+        if flags & E_SUMMONED:
+            summoned.append(e)
+        if flags & E_HUNTING:
+            e.hunting = True
+        enemies.append(e)
+    boss = next((e for e in enemies if isinstance(e, Necromancer)), None)
+    for e in summoned:
+        e.parent = boss
+
+    level = Level(
+        matrix=matrix,
+        rooms=rooms,
+        start_room=start_room,
+        final_rooms=final_rooms,
+        items=items,
+        board=Board(cells=cells, side=side, entrance=entrance),
+        enemies=enemies,
+        config=config,
+    )
+    level.room_ids = room_grid(level)
+    for i, room in corridors:
+        level.room_ids[i] = room
+    return level
+
+
+def build_floor(kind: str, config: GenConfig, seed: int) -> bytes:
+    return pack_level(FLOOR_TYPES[kind](config, seed))
+
+
+# a floor the player is not on, compressed
+@dataclass(frozen=True)
+class FrozenLevel:
+    pack: bytes
+    visited: Optional[bytes] = None
+
+
+def freeze_pack(data: bytes) -> FrozenLevel:
+    return FrozenLevel(zlib.compress(data))
+
+
+def freeze(level: Level, visited: Optional[CellSet] = None) -> FrozenLevel:
+    return FrozenLevel(
+        zlib.compress(pack_level(level)),
+        None if visited is None else zlib.compress(visited.bits),
+    )
+
+
+def thaw(frozen: FrozenLevel) -> Tuple[Level, CellSet]:
+    level = unpack_level(zlib.decompress(frozen.pack))
+    visited = CellSet(level.grid.side)
+    if frozen.visited is not None:
+        visited.bits[:] = zlib.decompress(frozen.visited)
+    return level, visited
+
+
+def swap_floors(state: State, n: int):
+    """Level listener: freeze the floor being left, thaw floor `n`"""
+    levels, visited = state.levels, state.visited_by_floor
+    current = state.current_level
+    if 0 <= current < len(levels):
+        left = levels[current]
+        if isinstance(left, Level):
+            levels[current] = freeze(left, visited[current])
+            visited[current] = None
+    entered = levels[n]
+    if isinstance(entered, FrozenLevel):
+        levels[n], visited[n] = thaw(entered)
+        # the thawed board counts its revisions from 0 again
+        state.chase_key = state.fov_key = None
@@ -1,20 +1,53 @@
-# 1TRBL
+from typing import List, Optional, Tuple
+
+from rogue.constants import WALL_BASE
+
+# WALL_BASE | TRBL
 WALLS = {
     1: (8, 8),
-    10000: (24, 16),
-    10001: (40, 0),
-    10010: (24, 8),
-    10011: (16, 0),
-    10100: (24, 0),
-    10101: (32, 0),
-    10110: (0, 0),
-    10111: (8, 0),
-    11000: (40, 8),
-    11001: (16, 16),
-    11010: (32, 8),
-    11011: (16, 8),
-    11100: (0, 16),
-    11101: (8, 16),
-    11110: (0, 8),
-    11111: (8, 8),
+    WALL_BASE | 0b0000: (24, 16),
+    WALL_BASE | 0b0001: (40, 0),
+    WALL_BASE | 0b0010: (24, 8),
+    WALL_BASE | 0b0011: (16, 0),
+    WALL_BASE | 0b0100: (24, 0),
+    WALL_BASE | 0b0101: (32, 0),
+    WALL_BASE | 0b0110: (0, 0),
+    WALL_BASE | 0b0111: (8, 0),
+    WALL_BASE | 0b1000: (40, 8),
+    WALL_BASE | 0b1001: (16, 16),
+    WALL_BASE | 0b1010: (32, 8),
+    WALL_BASE | 0b1011: (16, 8),
+    WALL_BASE | 0b1100: (0, 16),
+    WALL_BASE | 0b1101: (8, 16),
+    WALL_BASE | 0b1110: (0, 8),
+    WALL_BASE | 0b1111: (8, 8),
 }
+
+NON_WALLS = {
+    0: (32, 16),
+    30: (40, 24),
+    31: (0, 24),
+    32: (8, 24),
+    33: (16, 24),
+    34: (40, 16),
+    35: (48, 8),
+    40: (40, 32),
+    41: (32, 32),
+    42: (32, 32),
+    43: (32, 32),
+    20: (48, 0),
+    21: (56, 16),
+    22: (56, 8),
+    23: (56, 0),
+    25: (64, 0),
+    26: (72, 16),
+    27: (72, 8),
+    28: (72, 0),
+    66: (64, 16),  # UP
+    99: (64, 24),  # DOWN
+}
+
+# uv of every tile id, indexed by the tile id itself
+TILE_UVS: List[Optional[Tuple[int, int]]] = [None] * 256
+for _tile, _uv in {**WALLS, **NON_WALLS}.items():
+    TILE_UVS[_tile] = _uv
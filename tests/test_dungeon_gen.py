@@ -0,0 +1,16 @@
+import random
+
+import pytest
+
+from rogue.core import Board
+from rogue.dungeon_gen import clean_board, clean_board_reference
+
+
+@pytest.mark.parametrize("side", [1, 2, 5, 16, 33])
+def test_clean_board_matches_the_reference(side):
+    rng = random.Random(side)
+    for _ in range(40):
+        cells = bytes(rng.choice((0, 0, 1, 1, 2)) for _ in range(side * side))
+        fast = clean_board(Board(bytearray(cells), side))
+        slow = clean_board_reference(Board(bytearray(cells), side))
+        assert fast.cells == slow.cells
@@ -0,0 +1,14 @@
+import pytest
+
+from rogue.core import FOV_ENGINES, GenConfig, ray_fov
+from rogue.dungeon_gen import FLOOR_TYPES
+
+
+@pytest.mark.parametrize("engine", ["table", "shadowcast"])
+@pytest.mark.parametrize("kind", ["level_1", "cave"])
+def test_engines_see_what_the_rays_see(engine, kind):
+    board = FLOOR_TYPES[kind](GenConfig(), 3).board
+    fov = FOV_ENGINES[engine]
+    for i in range(0, len(board), 5):
+        origin = board.to_pos(i)
+        assert set(fov(board, origin, 5)) == set(ray_fov(board, origin, 5))
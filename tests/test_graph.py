@@ -0,0 +1,39 @@
+import random
+
+import pytest
+
+from rogue.constants import WALL_BASE
+from rogue.core import GenConfig, is_empty
+from rogue.dungeon_gen import FLOOR_TYPES
+from rogue.graph import board_graph, cluster_paths
+
+
+def _check_paths(board, planner, rng):
+    walkable = [i for i in range(len(board)) if is_empty(board[i])]
+    for _ in range(100):
+        start, goal = rng.choice(walkable), rng.choice(walkable)
+        path = planner.find_path(start, goal)
+        reached = board_graph(board, is_empty).search(start).reached(goal)
+        assert (path is not None) == reached
+        if not path:
+            continue
+        assert path[-1] == goal
+        for a, b in zip([start] + path, path):
+            assert board.to_pos(b) in board.neighbours(*board.to_pos(a))
+            assert is_empty(board[b])
+
+
+@pytest.mark.parametrize("kind", ["level_1", "level_2", "cave"])
+def test_cluster_paths_agree_with_the_board(kind):
+    config = GenConfig()
+    board = FLOOR_TYPES[kind](config, 5).board
+    planner = cluster_paths(board, is_empty, config.max_room_size)
+    rng = random.Random(kind)
+    _check_paths(board, planner, rng)
+
+    # wall off and dig through random squares, the planner catches up
+    for _ in range(5):
+        for _ in range(40):
+            i = rng.randrange(len(board))
+            board[i] = WALL_BASE if is_empty(board[i]) else 0
+        _check_paths(board, planner, rng)
@@ -0,0 +1,27 @@
+import os
+
+from rogue.core import GenConfig
+from rogue.levelcache import LevelCache, SUFFIX
+
+
+def _size(cache):
+    return sum(size for _, _, size, _ in cache.entries())
+
+
+def test_eviction_stays_within_max_bytes(tmp_path):
+    stale = tmp_path / f"000000000000-cave-4x8-1{SUFFIX}"
+    stale.write_bytes(b"x" * 100)
+    cache = LevelCache(str(tmp_path), max_bytes=10_000)
+    for seed in range(300):
+        cache.store("cave", GenConfig(), seed, bytes(seed % 7 * 100 + 300))
+        assert _size(cache) <= cache.max_bytes
+    assert not stale.exists()
+    assert cache.read("cave", GenConfig(), 0) is None
+
+
+def test_fetch_generates_then_reads(tmp_path):
+    cache = LevelCache(str(tmp_path))
+    data = cache.fetch("level_1", GenConfig(), 3)
+    assert os.path.exists(cache.entry("level_1", GenConfig(), 3))
+    assert cache.load("level_1", GenConfig(), 3) is not None
+    assert cache.fetch("level_1", GenConfig(), 3) == data
@@ -0,0 +1,28 @@
+import pytest
+
+from rogue.core import GenConfig
+from rogue.dungeon_gen import FLOOR_TYPES
+from rogue.levelpack import pack_level, unpack_level
+
+
+@pytest.mark.parametrize("kind", sorted(FLOOR_TYPES))
+@pytest.mark.parametrize("config", [GenConfig(), GenConfig(6, 10, True)])
+def test_pack_round_trip(kind, config):
+    level = FLOOR_TYPES[kind](config, 11)
+    data = pack_level(level)
+    back = unpack_level(data)
+
+    assert back.config == level.config
+    assert back.matrix == level.matrix
+    assert back.rooms == level.rooms
+    assert back.final_rooms == level.final_rooms
+    assert back.board.cells == level.board.cells
+    assert back.board.entrance == level.board.entrance
+    assert back.room_ids == level.room_ids
+    assert [(type(i), i.square) for i in back.items] == [
+        (type(i), i.square) for i in level.items
+    ]
+    assert [(type(e), e.square, e.pv) for e in back.enemies] == [
+        (type(e), e.square, e.pv) for e in level.enemies
+    ]
+    assert pack_level(back) == data
@@ -0,0 +1,57 @@
+from rogue.constants import DOWN
+from rogue.core import GenConfig, State, is_door, is_empty
+from rogue.dungeon_gen import FLOOR_TYPES
+from rogue.enemies import chase_map
+from rogue.graph import board_graph
+from rogue.levelpack import swap_floors
+from rogue.player import Player
+
+
+def _state(kinds):
+    levels = [FLOOR_TYPES[kind](GenConfig(), 7) for kind in kinds]
+    return State(
+        levels=levels,
+        current_level=len(levels) - 1,
+        camera=(0, 0),
+        player=Player((0, 0), 9000),
+        visited_by_floor=[None] * len(levels),
+    )
+
+
+def test_going_up_lands_on_the_stairs_down():
+    state = _state(["level_1", "level_2"])
+    state.change_level(-1)
+    assert state.board[state.board.to_index(*state.player.square)] == DOWN
+
+
+def test_going_up_to_a_floor_without_stairs_down():
+    state = _state(["level_1", "level_2"])
+    board = state.levels[0].board
+    for i in board.where(DOWN):
+        board[i] = 0
+    state.change_level(-1)
+    assert state.player.square == board.to_pos(board.entrance)
+
+
+def test_chase_map_is_not_reused_across_a_thaw():
+    state = _state(["level_1", "level_2"])
+    state.level_listeners.append(swap_floors)
+    # thawed once, so that its board revision starts from 0
+    state.change_level(-1)
+    state.change_level(1)
+    state.change_level(-1)
+    entrance = state.board.to_pos(state.board.entrance)
+    state.player.pos = entrance
+    chase_map(state)
+
+    for i in range(len(state.board)):
+        if is_door(state.board[i]):
+            state.board[i] = 0
+    state.change_level(1)
+    state.change_level(-1)
+    state.player.pos = entrance
+    board = state.board
+    expected = board_graph(board, is_empty).distances(
+        board.entrance, max_dist=state.active_range
+    )
+    assert chase_map(state) == expected